@@ -0,0 +1,103 @@
+#####################################################################
+## Benchmark bufora kolumnowego pomiędzy etapami extract i transform ##
+#####################################################################
+"""
+Compares the extract/transform boundary as a list of row dictionaries (the previous
+path) with the columnar UnitColumns buffer, at 1x, 10x and 100x the number of units
+of a real month (about 500).
+
+For every scale the same JSON pages are decoded and transformed by both paths. The
+report shows the memory held by the decoded data between the stages, the peak memory
+(tracemalloc) and the time of decode + transform, and checks that the CSV output is
+identical.
+
+Usage:
+    python benchmarks/bench_columns.py [--scales 1 10 100] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bdl import build_units  # noqa: E402
+from etl.decode import UnitColumns, decode_page, loads  # noqa: E402
+from etl.extract import PAGE_SIZE  # noqa: E402
+from etl.transform import Transform  # noqa: E402
+
+
+def make_pages(scale):
+    units = build_units(380) * scale
+    pages = []
+    for start in range(0, len(units), PAGE_SIZE):
+        results = [
+            {
+                "id": unit_id,
+                "name": name,
+                "values": [{"year": "2020", "val": round(1 + index % 290 / 10, 1), "attrId": 1}],
+            }
+            for index, (unit_id, name) in enumerate(units[start : start + PAGE_SIZE], start)
+        ]
+        pages.append(json.dumps({"totalRecords": len(units), "results": results}).encode("UTF-8"))
+    return len(units), pages
+
+
+def extract_rows(pages):
+    ## the previous boundary: one dictionary per unit
+    rows = []
+    for content in pages:
+        for row in loads(content)["results"]:
+            rows.append({"id": row["id"], "name": row["name"], "stopa": row["values"][0]["val"]})
+    return rows
+
+
+def extract_columns(pages):
+    return UnitColumns.concat(decode_page(content).columns for content in pages)
+
+
+def measure(extract, pages, repeat):
+    transform = Transform()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = transform.transform_data_from_API(extract(pages))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    data = extract(pages)
+    held, _ = tracemalloc.get_traced_memory()
+    transform.transform_data_from_API(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, held, peak, result.to_csv(sep=";", index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar buffer benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'scale':>5} {'units':>7}  {'path':<8} {'held MB':>8} {'peak MB':>8} {'time s':>8}"
+    )
+    for scale in args.scales:
+        units, pages = make_pages(scale)
+        rows = measure(extract_rows, pages, args.repeat)
+        columns = measure(extract_columns, pages, args.repeat)
+        for name, (elapsed, held, peak, _) in (("rows", rows), ("columns", columns)):
+            print(
+                f"{scale:>4}x {units:>7}  {name:<8} {held / 1024 / 1024:>8.2f} "
+                f"{peak / 1024 / 1024:>8.2f} {elapsed:>8.3f}"
+            )
+        print(f"{'':>14}identical CSV: {rows[3] == columns[3]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#####################################################################
+## Benchmark całego procesu ETL na lokalnym serwerze udającym BDL ##
+#####################################################################
+"""
+Runs UnemploymentDownloader.run_ETL end to end against the local mock BDL server
+and reports throughput and per-stage timings (extract / transform / load).
+
+The API rate limiter is disabled by default, so the results show the pipeline
+itself and not the BDL quota. Every run works in a temporary folder.
+
+Usage:
+    python benchmarks/bench_etl.py [--years 2] [--powiaty 380] [--latency 0.05]
+        [--jobs 1] [--backend sync] [--batch] [--error-rate 0]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bdl import MockBDLServer  # noqa: E402
+
+
+class StageTimer:
+    """
+    Collects call durations per stage. Time spent in a nested stage of the same
+    thread (e.g. HTTP requests made while Transform consumes streamed pages) is
+    subtracted from the outer stage.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations = {}
+        self.own = {}
+
+    def wrap(self, stage, function):
+        def wrapper(*args, **kwargs):
+            stack = getattr(self.local, "stack", None)
+            if stack is None:
+                stack = self.local.stack = []
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                with self.lock:
+                    self.durations.setdefault(stage, []).append(elapsed)
+                    self.own[stage] = self.own.get(stage, 0.0) + elapsed - nested
+
+        return wrapper
+
+    def report(self, stage):
+        values = sorted(self.durations.get(stage, []))
+        if not values:
+            return None
+        return {
+            "calls": len(values),
+            "total_s": round(sum(values), 4),
+            "own_s": round(self.own.get(stage, 0.0), 4),
+            "mean_ms": round(1000 * sum(values) / len(values), 2),
+            "p50_ms": round(1000 * values[len(values) // 2], 2),
+            "p95_ms": round(1000 * values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        }
+
+
+def make_config(first_year, years):
+    return {
+        "Year": {
+            str(year): {
+                "All_downloaded": False,
+                "Months": {str(month).zfill(2): False for month in range(1, 13)},
+            }
+            for year in range(first_year, first_year + years)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ETL benchmark")
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--first-year", type=int, default=2015)
+    parser.add_argument("--powiaty", type=int, default=380)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--backend", choices=["sync", "async"], default="sync")
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--transform-workers", type=int, default=0)
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the BDL rate limits")
+    parser.add_argument("--no-compress", action="store_true", help="Send uncompressed responses")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    server = MockBDLServer(
+        powiaty=args.powiaty,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        compress=not args.no_compress,
+    ).start()
+    os.environ["bdlApiUrl"] = server.base_url
+    os.environ["outputFolder"] = "output"
+    os.environ.pop("X-ClientId", None)
+
+    from downloader import UnemploymentDownloader
+    from etl.ratelimit import RateLimiter
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_etl_"))
+    with open("config.json", "w") as f:
+        json.dump(make_config(args.first_year, args.years), f, indent=4)
+
+    client = UnemploymentDownloader(
+        config="config.json",
+        jobs=args.jobs,
+        backend=args.backend,
+        batch=args.batch,
+        transform_workers=args.transform_workers,
+        use_cache=False,
+        overwrite="always",
+    )
+    if not args.rate_limit:
+        unlimited = {"anonymous": [(1, 1000000)], "registered": [(1, 1000000)]}
+        client.api.rate_limiter = RateLimiter(limits=unlimited)
+        client.api.request_handler.rate_limiter = client.api.rate_limiter
+
+    timer = StageTimer()
+    client.api.get_response = timer.wrap("http", client.api.get_response)
+    client.transform_data = timer.wrap("transform", client.transform_data)
+    for saver in client.savers:
+        saver.save_dataframe = timer.wrap("load", saver.save_dataframe)
+
+    start = time.perf_counter()
+    client.run_ETL()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    months = len(timer.durations.get("load", []))
+    report = {
+        "settings": vars(args),
+        "wall_s": round(elapsed, 3),
+        "months": months,
+        "requests": server.requests,
+        "errors": server.errors,
+        "connections": server.connections,
+        "transport": client.api.transport.stats(),
+        "months_per_s": round(months / elapsed, 2) if elapsed else None,
+        "requests_per_s": round(server.requests / elapsed, 2) if elapsed else None,
+        "stages": {
+            "extract (http)": timer.report("http"),
+            "transform": timer.report("transform"),
+            "load": timer.report("load"),
+        },
+    }
+    client.close()
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+
+    print(f"wall time:   {report['wall_s']} s")
+    print(f"months:      {months} ({report['months_per_s']} / s)")
+    print(f"requests:    {server.requests} ({report['requests_per_s']} / s, {server.errors} errors)")
+    transport = report["transport"]
+    print(
+        f"connections: {server.connections} ({transport['connection_reuse']:.1%} of requests reused one)"
+    )
+    print(
+        f"traffic:     {transport['wire_bytes'] / 1024:.0f} KB on the wire, "
+        f"{transport['body_bytes'] / 1024:.0f} KB decoded ({transport['compression_saving']:.1%} saved)"
+    )
+    for stage, values in report["stages"].items():
+        if values:
+            print(
+                f"{stage:<15} calls {values['calls']:>5}  total {values['total_s']:>8.3f} s  "
+                f"own {values['own_s']:>8.3f} s  mean {values['mean_ms']:>8.2f} ms  "
+                f"p95 {values['p95_ms']:>8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
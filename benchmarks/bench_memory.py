@@ -0,0 +1,74 @@
+##############################################################################
+## Benchmark pamięci: uzupełnienie 10 lat danych z i bez przechowywania wyników ##
+##############################################################################
+"""
+Measures the peak Python memory (tracemalloc) of a 10-year backfill run through
+UnemploymentDownloader.run_ETL. Pages are generated locally instead of being
+downloaded, so only the pipeline itself is measured.
+
+Usage:
+    python benchmarks/bench_memory.py [--years 10] [--units 500]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import UnemploymentDownloader  # noqa: E402
+from etl.decode import UnitColumns  # noqa: E402
+from etl.extract import PAGE_SIZE  # noqa: E402
+
+
+def make_page_generator(units):
+    def iter_pages(variable_id, year):
+        for start in range(0, units, PAGE_SIZE):
+            page = range(start, min(units, start + PAGE_SIZE))
+            yield UnitColumns.from_lists(
+                [f"0{1 + i % 7}{2 + 2 * (i % 16):02d}1{i % 100:02d}{i % 99 + 1:02d}000" for i in page],
+                [f"Powiat nazwa{i}" for i in page],
+                [round(1 + (i * 7 % 290) / 10, 1) for i in page],
+            )
+
+    return iter_pages
+
+
+def run(years, units, keep_results):
+    os.chdir(tempfile.mkdtemp())
+    os.environ["outputFolder"] = "output"
+    client = UnemploymentDownloader(
+        year="2000", use_cache=False, keep_results=keep_results
+    )
+    client.api.iter_pages = make_page_generator(units)
+    first_year = 2010
+    key_dict = {
+        str(year): [str(month).zfill(2) for month in range(1, 13)]
+        for year in range(first_year, first_year + years)
+    }
+    client.GetDictYearMonthToDownload = lambda: key_dict
+
+    tracemalloc.start()
+    client.run_ETL()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark")
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--units", type=int, default=500)
+    args = parser.parse_args()
+
+    streaming = run(args.years, args.units, keep_results=False)
+    kept = run(args.years, args.units, keep_results=True)
+    print(f"months:                {args.years * 12} ({args.units} units each)")
+    print(f"peak, streaming:       {streaming / 1024 / 1024:.1f} MB")
+    print(f"peak, keep_results:    {kept / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+###########################################################
+## Benchmark czasu uruchomienia programu (import modułów) ##
+###########################################################
+"""
+Measures the startup cost of main.py commands with `python -X importtime`.
+
+Every command is run several times in a temporary copy of config.json. The report
+shows the wall time, the cumulative import time of all top-level modules and the
+number of imported modules, compared with importing the whole ETL stack
+(what every command paid before the imports in main.py were made lazy).
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+COMMANDS = {
+    "--help": [MAIN, "--help"],
+    "--add_year 1": [MAIN, "--add_year", "1"],
+    "--clear_cache": [MAIN, "--clear_cache"],
+    "full ETL imports": [
+        "-c",
+        f"import sys; sys.path.insert(0, {ROOT!r}); "
+        "import main, downloader, logger, utilities",
+    ],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Sums the cumulative time of the top-level imports from -X importtime output.
+
+    Returns:
+        tuple: Cumulative import time in milliseconds and number of imported modules.
+    """
+    total_us = 0
+    modules = 0
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        modules += 1
+        if len(match.group(3)) == 1:
+            total_us += int(match.group(2))
+    return total_us / 1000, modules
+
+
+def run_command(arguments, workdir):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall_ms = 1000 * (time.perf_counter() - start)
+    import_ms, modules = parse_importtime(result.stderr)
+    return wall_ms, import_ms, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    config = os.path.join(ROOT, "config.json")
+    try:
+        print(f"{'command':<20} {'wall ms':>9} {'import ms':>10} {'modules':>8}")
+        for name, arguments in COMMANDS.items():
+            results = []
+            for _ in range(args.runs):
+                shutil.copy(config, os.path.join(workdir, "config.json"))
+                results.append(run_command(arguments, workdir))
+            wall_ms = statistics.median(result[0] for result in results)
+            import_ms = statistics.median(result[1] for result in results)
+            modules = results[-1][2]
+            print(f"{name:<20} {wall_ms:>9.1f} {import_ms:>10.1f} {modules:>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+##############################################################################
+## Benchmark etapu Transform: klasyfikacja ID regexami vs. wektorowo (numpy) ##
+##############################################################################
+"""
+Compares the regex based ID filtering of the previous Transform implementation
+with the vectorized classification on a synthetic input and checks that both
+produce byte-identical CSV output.
+
+Usage:
+    python benchmarks/bench_transform.py [--rows 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.transform import Transform  # noqa: E402
+
+
+class LegacyTransform(Transform):
+    """
+    Transform with the regex filtering and iterrows labelling used before the vectorization.
+    """
+
+    def transform_data_from_API(self, data):
+        df = pd.DataFrame(data)
+        df = df[df["id"].notnull()]
+        for pat in self.ID_PATTERNS.values():
+            if pat == ".*REGION.*":
+                df = df[
+                    ~df["id"]
+                    .astype(str)
+                    .str.contains(pat, flags=re.IGNORECASE, regex=True)
+                ]
+            else:
+                df = df[df["id"].astype("string").str.extract(pat, expand=False).isna()]
+        df["WOJ."] = df["id"].str[2:4]
+        df["POW."] = df["id"].str[7:9]
+        df[""] = ""
+        df = self.map_columns(df, ["WOJ.", "POW.", "", "name", "stopa"])
+        df = self.transform_column(df, "name", "Powiat", "", False)
+        df = self.transform_column(df, "stopa", ".", ",", False)
+        for index, row in df.iterrows():
+            if row["WOJ."] != "00" and row["POW."] == "00":
+                df.at[index, "name"] = "WOJ. " + row["name"]
+        return df
+
+
+def make_rows(count, seed=0):
+    """
+    Builds synthetic API rows with a mix of all unit levels.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        kind = rng.random()
+        makro = rng.randint(1, 7)
+        woj = rng.randint(1, 16) * 2
+        if kind < 0.01:
+            unit_id = f"0{makro}0000000000"
+        elif kind < 0.05:
+            unit_id = f"0{makro}{woj:02d}{rng.randint(1, 2)}0000000"
+        elif kind < 0.10:
+            unit_id = f"0{makro}{woj:02d}{rng.randint(1, 2)}{rng.randint(1, 99):02d}00000"
+        elif kind < 0.12:
+            unit_id = f"0{makro}{woj:02d}{rng.randint(1, 2)}{rng.randint(0, 99):02d}998"
+        elif kind < 0.13:
+            unit_id = f"REGION{i % 1000000:06d}"
+        elif kind < 0.20:
+            unit_id = f"0{makro}{woj:02d}{rng.randint(1, 2)}00000000"[:7] + "00000"
+        else:
+            unit_id = f"0{makro}{woj:02d}{rng.randint(1, 2)}{rng.randint(1, 99):02d}{rng.randint(1, 99):02d}000"
+        rows.append(
+            {
+                "id": unit_id,
+                "name": f"Powiat nazwa{i}",
+                "stopa": round(rng.uniform(1, 30), 1),
+            }
+        )
+    return rows
+
+
+def measure(transform, rows, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = transform.transform_data_from_API(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transform benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    legacy_time, legacy_df = measure(LegacyTransform(), rows, args.repeat)
+    new_time, new_df = measure(Transform(), rows, args.repeat)
+
+    legacy_csv = legacy_df.to_csv(sep=";", index=False).encode("UTF-8")
+    new_csv = new_df.to_csv(sep=";", index=False).encode("UTF-8")
+
+    print(f"rows:        {args.rows}")
+    print(f"regex:       {legacy_time:.3f} s")
+    print(f"vectorized:  {new_time:.3f} s")
+    print(f"speed-up:    {legacy_time / new_time:.1f}x")
+    print(f"identical:   {legacy_csv == new_csv}")
+    if legacy_csv != new_csv:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
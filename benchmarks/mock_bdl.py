@@ -0,0 +1,258 @@
+##########################################################################
+## Lokalny serwer udający endpoint data/by-Variable API BDL (benchmarki) ##
+##########################################################################
+"""
+Local stand-in for https://bdl.stat.gov.pl/api/v1/data/by-Variable.
+
+Serves synthetic paginated payloads with the shape of the real API (totalRecords,
+links.next, results with 12-character ids and values per year), with configurable
+latency, error rate and number of units. Responses are gzip-compressed when the
+client accepts it.
+
+Usage:
+    python benchmarks/mock_bdl.py [--port 8080] [--powiaty 380] [--latency 0.05]
+
+Then point the client to it with the bdlApiUrl variable:
+    bdlApiUrl=http://127.0.0.1:8080/api/v1 python main.py --year 2020
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+PATH_PATTERN = re.compile(r"^/api/v1/data/by-Variable/(\d+)$", re.IGNORECASE)
+
+
+def build_units(powiaty=380):
+    """
+    Builds a synthetic unit list with every level returned by BDL.
+
+    Args:
+        powiaty (int): Number of powiats. Defaults to 380.
+
+    Returns:
+        list: (id, name) tuples ordered like the API: Polska, macroregions, regions,
+            voivodeships, subregions, powiats and unspecified units.
+    """
+    units = [("000000000000", "POLSKA")]
+    voivodeships = [2 * number for number in range(1, 17)]
+    for makro in range(1, 8):
+        units.append((f"0{makro}0000000000", f"MAKROREGION {makro}"))
+    for index, woj in enumerate(voivodeships):
+        makro = index % 7 + 1
+        units.append((f"0{makro}{woj:02d}10000000", f"REGION {woj}"))
+        units.append((f"0{makro}{woj:02d}00000000", f"WOJEWÓDZTWO {woj}"))
+    for index in range(powiaty):
+        woj = voivodeships[index % 16]
+        makro = voivodeships.index(woj) % 7 + 1
+        podregion = index // 16 % 5 + 1
+        powiat = index // 16 + 1
+        if index < 16 * 5:
+            units.append(
+                (f"0{makro}{woj:02d}1{podregion:02d}00000", f"PODREGION {woj}-{podregion}")
+            )
+        units.append(
+            (f"0{makro}{woj:02d}1{podregion:02d}{powiat:02d}000", f"Powiat nr {index + 1}")
+        )
+    for woj in voivodeships:
+        units.append((f"0{voivodeships.index(woj) % 7 + 1}{woj:02d}10000998", "Nieokreślony"))
+    return units
+
+
+class MockBDLServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server serving the synthetic by-Variable payloads.
+
+    Args:
+        address (tuple): (host, port) to listen on, port 0 picks a free port.
+        powiaty (int): Number of powiats. Defaults to 380.
+        latency (float): Seconds added to every response. Defaults to 0.
+        error_rate (float): Share of requests answered with error_status. Defaults to 0.
+        error_status (int): Status code of the failed requests. Defaults to 503.
+        last_year (int): Years after it have no data (unpublished). Defaults to 2100.
+        last_month_variable (str): Variables after it have no data for last_year (optional).
+        seed (int): Seed of the error generator. Defaults to 0.
+        compress (bool): Gzip the responses if the client accepts it. Defaults to True.
+
+    Attributes:
+        requests (int): Number of requests served.
+        errors (int): Number of error responses.
+        connections (int): Number of accepted connections.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        powiaty=380,
+        latency=0.0,
+        error_rate=0.0,
+        error_status=503,
+        last_year=2100,
+        last_month_variable=None,
+        seed=0,
+        compress=True,
+    ):
+        super().__init__(address, MockBDLHandler)
+        self.units = build_units(powiaty)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.last_year = last_year
+        self.last_month_variable = last_month_variable
+        self.random = random.Random(seed)
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def is_published(self, variable_id, year):
+        if year > self.last_year:
+            return False
+        if year == self.last_year and self.last_month_variable:
+            return variable_id <= self.last_month_variable
+        return True
+
+    def start(self):
+        """
+        Starts serving in a daemon thread and returns the server.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class MockBDLHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ## the headers and the body are written separately, Nagle would delay the body by ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        match = PATH_PATTERN.match(url.path)
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            failed = server.random.random() < server.error_rate
+            if failed:
+                server.errors += 1
+        if match is None:
+            self.send_json(404, {"errors": [{"message": "Not found"}]})
+            return
+        if failed:
+            self.send_json(server.error_status, {"errors": [{"message": "Mock error"}]})
+            return
+
+        variable_id = match.group(1)
+        query = parse_qs(url.query)
+        years = [int(year) for year in query.get("year", [])]
+        page_size = int(query.get("page-size", ["10"])[0])
+        page = int(query.get("page", ["0"])[0])
+
+        published = [year for year in years if server.is_published(variable_id, year)]
+        units = server.units if published else []
+        total = len(units)
+        results = [
+            {
+                "id": unit_id,
+                "name": name,
+                "values": [
+                    {
+                        "year": str(year),
+                        "val": round(1 + (index * 37 + year + int(variable_id)) % 290 / 10, 1),
+                        "attrId": 1,
+                    }
+                    for year in published
+                ],
+            }
+            for index, (unit_id, name) in enumerate(
+                units[page * page_size : (page + 1) * page_size], start=page * page_size
+            )
+        ]
+
+        base = f"{server.base_url}/data/by-Variable/{variable_id}"
+        year_query = "&".join(f"year={year}" for year in years)
+        links = {
+            "first": f"{base}?{year_query}&format=json&page-size={page_size}&page=0",
+            "self": f"{base}?{year_query}&format=json&page-size={page_size}&page={page}",
+        }
+        if (page + 1) * page_size < total:
+            links["next"] = f"{base}?{year_query}&format=json&page-size={page_size}&page={page + 1}"
+        self.send_json(
+            200,
+            {
+                "totalRecords": total,
+                "page": page,
+                "pageSize": page_size,
+                "links": links,
+                "results": results,
+            },
+        )
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if self.server.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock BDL API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--powiaty", type=int, default=380)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--last-year", type=int, default=2100)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+
+    server = MockBDLServer(
+        (args.host, args.port),
+        powiaty=args.powiaty,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        last_year=args.last_year,
+        compress=not args.no_compress,
+    )
+    print(f"Mock BDL API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
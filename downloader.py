@@ -1,13 +1,47 @@
-from etl.extract import Extractor
-from etl.transform import Transform
-from etl.load import FileManager, CsvSaver
-from utilities import ConfigManager
-import json
+from etl.cache import ResponseCache
+from etl.checkpoint import CheckpointSpool
+from etl.metrics import metrics
+from etl.extract import PAGE_SIZE, Extractor, IncompleteDataError
+from etl.transform import Transform, TransformPool
+from etl.probe import PublicationProbe
+from etl.load import FileManager, CsvSaver, ParquetSaver, WarehouseSaver
+from logger import LazyJson
+from utilities import ConfigManager, SqliteConfigManager, month_range
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
 from logging import getLogger
+from datetime import date
+import math
+import os
+import threading
+
+ASYNC_IN_FLIGHT = 4
+## about 380 powiats, 16 voivodeships and the higher levels, used to estimate the requests
+UNITS_PER_MONTH = 500
 
 
 class UnemploymentDownloader:
-    def __init__(self, config=None, year=None, month=None) -> None:
+    def __init__(
+        self,
+        config=None,
+        year=None,
+        month=None,
+        jobs=1,
+        backend="sync",
+        use_cache=True,
+        batch=False,
+        parquet_folder=None,
+        keep_results=False,
+        overwrite="ask",
+        state="json",
+        warehouse_path=None,
+        probe=False,
+        metrics_folder=None,
+        checkpoint=True,
+        transform_workers=0,
+        date_range=None,
+    ) -> None:
         """
         Initialize the UnemploymentDownloader class.
 
@@ -15,15 +49,68 @@ class UnemploymentDownloader:
             config (str): Path to the configuration file (optional).
             year (str): Year to extract data for (optional).
             month (str): Month to extract data for (optional).
+            jobs (int): Number of (year, month) units processed in parallel. Defaults to 1 (serial).
+            backend (str): Page fetching backend, "sync" or "async". Defaults to "sync".
+            use_cache (bool): Use the on-disk response cache. Defaults to True.
+            batch (bool): Download each month for all years in one crawl. Defaults to False.
+            parquet_folder (str): Also save the data as Parquet into this folder (optional).
+            keep_results (bool): Keep the transformed DataFrames in stopy_bezrobocia after
+                they are saved. Defaults to False, finished months are released.
+            overwrite (str): Policy for existing CSV files: "ask", "always", "never"
+                or "if-changed". Defaults to "ask".
+            state (str): Download state backend, "json" (config.json) or "sqlite"
+                (state.db, exported to config.json at the end of the run). Defaults to "json".
+            warehouse_path (str): Also upsert the data into this SQLite database (optional).
+            probe (bool): Check with a one-row request whether a month is published before
+                crawling it, caching the answer. Defaults to False.
+            metrics_folder (str): Write the run metrics as JSON and Prometheus textfile
+                into this folder at the end of the run (optional).
+            checkpoint (bool): Spool every downloaded page, so an interrupted crawl resumes
+                from the last finished page. Defaults to True.
+            transform_workers (int): Run the Transform step on this many worker processes.
+                Defaults to 0 (in the downloading threads).
+            date_range (tuple): First and last month to download, as YYYY-MM (optional,
+                the last one may be None for the current month). The months are downloaded
+                from the newest one, months marked as downloaded in config.json are skipped
+                and saved months are marked there. A month without data doesn't stop its year.
         """
         self.config = config
         self.year = year
         self.month = month
+        self.date_range = date_range
+        ## with a date range a month without data is skipped, otherwise it stops its year
+        self.stop_at_missing = date_range is None
+        self.tracked_months = set()
+        ## set by stop(), no new month is started afterwards
+        self.stop_requested = threading.Event()
+        self.jobs = max(1, int(jobs))
+        self.backend = backend
+        self.batch = batch
+        self.keep_results = keep_results
+        self.metrics_folder = metrics_folder
         self.stopy_bezrobocia = {}
-        self.api = Extractor()
+        self.cache = ResponseCache() if use_cache else None
+        self.checkpoints = CheckpointSpool() if checkpoint else None
+        ## one pooled connection per concurrent request: every job runs up to
+        ## ASYNC_IN_FLIGHT requests with the async backend and one otherwise
+        self.api = Extractor(
+            cache=self.cache,
+            checkpoints=self.checkpoints,
+            pool_size=self.jobs * (ASYNC_IN_FLIGHT if backend == "async" else 1),
+        )
+        self.probe = PublicationProbe(self.api) if probe else None
         self.transform = Transform()
-        self.saver = CsvSaver(file_manager=FileManager())
-        self.configManager = ConfigManager()
+        self.transform_pool = TransformPool(transform_workers) if transform_workers else None
+        self.saver = CsvSaver(file_manager=FileManager(), overwrite=overwrite)
+        self.savers = [self.saver]
+        if parquet_folder:
+            self.savers.append(ParquetSaver(output_folder=parquet_folder))
+        if warehouse_path:
+            self.savers.append(WarehouseSaver(db_path=warehouse_path))
+        if state == "sqlite":
+            self.configManager = SqliteConfigManager()
+        else:
+            self.configManager = ConfigManager()
         self.logger = getLogger("__main__")
 
     def run_ETL(self):
@@ -31,31 +118,428 @@ class UnemploymentDownloader:
         Perform the ETL process - Extract, Transform, and Load.
 
         This method fetches data from an API, transforms it, and saves it to a CSV file.
+        With jobs > 1 the extract and transform steps run on a worker pool, while the
+        load step and config updates are done in order on the calling thread.
         """
+        metrics.reset()
+        starttime = time.time()
         key_dict = self.GetDictYearMonthToDownload()
+        if not key_dict:
+            return
+        try:
+            if self.batch:
+                self._run_batched(key_dict)
+            elif self.jobs > 1:
+                self._run_parallel(key_dict)
+            else:
+                self._run_serial(key_dict)
+        finally:
+            self.saver.retry_failed_writes()
+            if self.config or self.tracked_months:
+                self.configManager.flush("config.json")
+            if self.cache is not None:
+                self.cache.save_index()
+                self.logger.info(f"Response cache statistics: {self.cache.stats()}")
+            self.logger.info(f"HTTP transport statistics: {self.api.transport.stats()}")
+            if self.metrics_folder:
+                self.write_metrics(starttime)
+
+    def stop(self):
+        """
+        Asks a running run_ETL to stop. The months in progress are finished and saved,
+        no new month is started. Can be called from a signal handler or another thread.
+        """
+        self.stop_requested.set()
+
+    def close(self):
+        """
+        Stops the transform worker processes and closes the pooled connections.
+        """
+        if self.transform_pool is not None:
+            self.transform_pool.close()
+        self.api.transport.close()
+
+    def write_metrics(self, starttime):
+        """
+        Writes the metrics of the run into the metrics folder.
+
+        Args:
+            starttime (float): Start time of the run.
+        """
+        metrics.set_gauge("run_duration_seconds", round(time.time() - starttime, 3))
+        metrics.set_gauge("last_run_timestamp_seconds", int(time.time()))
+        metrics.set_gauge("failed_writes", len(self.saver.failed_writes))
+        if self.cache is not None:
+            for name, value in self.cache.stats().items():
+                if isinstance(value, (int, float)):
+                    metrics.set_gauge(f"cache_{name}", value)
+        for name, value in self.api.transport.stats().items():
+            metrics.set_gauge(f"transport_{name}", value)
+        try:
+            paths = metrics.write(self.metrics_folder)
+            self.logger.info(f"Metrics saved to: {paths}")
+        except OSError:
+            self.logger.exception("Error while trying to write the metrics")
+
+    def _run_serial(self, key_dict):
+        """
+        Runs the ETL for every (year, month) unit one after another.
+
+        Args:
+            key_dict (dict): A dictionary with years as keys and corresponding month lists as values.
+        """
         for year, month_list in key_dict.items():
-            self.stopy_bezrobocia[year] = {}
             for month in month_list:
-                variable_id = self.api.get_variable_id(month)
-                data = self.api.fetch_data(variable_id, year)
-                if not data:
-                    self.logger.warning(
-                        f"No data for variable: {variable_id}, year: {year}, month: {month}\n"
-                        "The next data won't be downloaded.\n"
-                        "The program is stopped."
-                    )
-                    break
-                clear_data = self.transform.transform_data_from_API(data)
-                self.stopy_bezrobocia[year][month] = clear_data
-                self.saver.save_dataframe(clear_data, month, year)
-                if self.config:
-                    self.configManager.update_config("config.json", year, month, True)
-                    self.configManager.check_all_data_downloaded("config.json")
+                if self.stop_requested.is_set():
+                    return
+                clear_data = self.extract_transform(year, month)
+                if clear_data is None:
+                    self._log_missing_data(year, month)
+                    if self.stop_at_missing:
+                        break
+                    continue
+                self.load(clear_data, year, month)
+
+    def _run_parallel(self, key_dict):
+        """
+        Runs the extract and transform steps for every (year, month) unit on a thread pool.
+
+        Results are loaded in the same order as in serial mode and loading of a year
+        stops at the first month without data (unless a date range is downloaded).
+        At most 2 * jobs months are in flight.
+
+        Args:
+            key_dict (dict): A dictionary with years as keys and corresponding month lists as values.
+        """
+        units = iter(
+            [(year, month) for year, month_list in key_dict.items() for month in month_list]
+        )
+        stopped_years = set()
+        pending = deque()
+
+        def submit_next(executor):
+            if self.stop_requested.is_set():
+                return
+            for year, month in units:
+                if year not in stopped_years:
+                    future = executor.submit(self.extract_transform, year, month)
+                    pending.append((year, month, future))
+                    return
+
+        ## only a bounded number of months is kept in flight, so finished months can be released
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for _ in range(2 * self.jobs):
+                submit_next(executor)
+            while pending:
+                year, month, future = pending.popleft()
+                clear_data = future.result()
+                if year not in stopped_years:
+                    if clear_data is None:
+                        self._log_missing_data(year, month)
+                        if self.stop_at_missing:
+                            stopped_years.add(year)
+                    else:
+                        self.load(clear_data, year, month)
+                elif self.checkpoints is not None:
+                    ## the month was fetched after its year stopped, the next run fetches it fresh
+                    self.checkpoints.discard(self.api.get_variable_id(month), year)
+                clear_data = future = None
+                submit_next(executor)
+
+    def _run_batched(self, key_dict):
+        """
+        Runs the ETL month by month, fetching a month for all of its years in one crawl.
+
+        Each month is a separate BDL variable, but one by-Variable crawl can return many
+        years, so a backfill needs at most twelve crawls. With jobs > 1 the crawls run
+        on a thread pool. A year stops at its first month without data, unless a date
+        range is downloaded; a date range is crawled from the month with the newest data.
+
+        Args:
+            key_dict (dict): A dictionary with years as keys and corresponding month lists as values.
+        """
+        months = sorted({month for month_list in key_dict.values() for month in month_list})
+        if not self.stop_at_missing:
+            ## the month with the newest data first
+            months.sort(
+                key=lambda month: max(
+                    (year, month) for year, month_list in key_dict.items() if month in month_list
+                ),
+                reverse=True,
+            )
+        stopped_years = set()
+
+        def crawl(month):
+            if self.stop_requested.is_set():
+                return {}
+            variable_id = self.api.get_variable_id(month)
+            years = [
+                year
+                for year, month_list in key_dict.items()
+                if month in month_list
+                and year not in stopped_years
+                and self.is_published(variable_id, year)
+            ]
+            if not years:
+                return {}
+            try:
+                return self.api.fetch_data_batch(variable_id, years)
+            except IncompleteDataError:
+                ## as in the other modes, the years of the month are handled as without data
+                self.logger.warning("The data is incomplete", exc_info=1)
+                for year in years:
+                    self.record_failure(year, month)
+                return {}
+            except Exception:
+                for year in years:
+                    self.record_failure(year, month)
+                raise
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            mapper = executor.map if self.jobs > 1 else map
+            for month, data_by_year in zip(months, mapper(crawl, months)):
+                ## after stop() the crawls not started yet return nothing, the finished ones are saved
+                if not data_by_year and self.stop_requested.is_set():
+                    continue
+                years = []
+                for year, month_list in key_dict.items():
+                    if month not in month_list or year in stopped_years:
+                        continue
+                    if not data_by_year.get(year):
+                        self._log_missing_data(year, month)
+                        if self.stop_at_missing:
+                            stopped_years.add(year)
+                        continue
+                    years.append(year)
+                ## the years of a month are transformed together, on the worker processes if enabled
+                try:
+                    frames = self.transform_data(*(data_by_year.pop(year) for year in years))
+                except Exception:
+                    for year in years:
+                        self.record_failure(year, month)
+                    raise
+                for year, clear_data in zip(years, frames):
+                    self.load(clear_data, year, month)
+                frames = clear_data = None
+
+    def extract_transform(self, year, month):
+        """
+        Fetches and transforms data for a single year and month.
+
+        With the sync backend the pages are streamed into the transform step
+        as they are downloaded.
+
+        Args:
+            year (str): Year to extract data for.
+            month (str): Month to extract data for.
+
+        Returns:
+            pd.DataFrame: Transformed data, or None if the API has no data for the month.
+        """
+        variable_id = self.api.get_variable_id(month)
+        if not self.is_published(variable_id, year):
+            return None
+        try:
+            if self.backend == "async":
+                data = self.api.fetch_data_async(variable_id, year, ASYNC_IN_FLIGHT)
+            else:
+                data = self.api.stream_data(variable_id, year)
+            if not data:
+                return None
+            return self.transform_data(data)[0]
+        except IncompleteDataError:
+            self.logger.warning("The data is incomplete", exc_info=1)
+            self.record_failure(year, month)
+            return None
+        except Exception:
+            self.record_failure(year, month)
+            raise
+
+    def transform_data(self, *data):
+        """
+        Transforms the data of one or more months.
+
+        Args:
+            *data: Data of every month, as returned by the extractor.
+
+        Returns:
+            list: Transformed DataFrames in the order of the arguments.
+        """
+        if self.transform_pool is not None:
+            return self.transform_pool.transform_many(data)
+        return [self.transform.transform_data_from_API(month_data) for month_data in data]
+
+    def is_published(self, variable_id, year):
+        """
+        Checks with the publication probe whether the data is published.
+
+        Returns:
+            bool: True if the data is published or the probe is disabled.
+        """
+        if self.probe is None:
+            return True
+        return self.probe.is_published(variable_id, year)
+
+    def _log_missing_data(self, year, month):
+        if not self.stop_at_missing:
+            self.logger.warning(
+                f"No data for variable: {self.api.get_variable_id(month)}, year: {year}, "
+                f"month: {month}. The month is skipped."
+            )
+            return
+        self.logger.warning(
+            f"No data for variable: {self.api.get_variable_id(month)}, year: {year}, month: {month}\n"
+            "The next data won't be downloaded.\n"
+            "The program is stopped."
+        )
+
+    def record_failure(self, year, month):
+        """
+        Records a failed attempt of a month in the download state.
+
+        Args:
+            year (str): Year of the month.
+            month (str): Month.
+        """
+        if not (self.config or (year, month) in self.tracked_months):
+            return
+        try:
+            self.configManager.record_failure("config.json", year, month)
+        except Exception:
+            ## the original error is more important than the state
+            self.logger.warning("The failed attempt couldn't be recorded", exc_info=1)
+
+    def load(self, clear_data, year, month):
+        """
+        Saves transformed data for a single year and month and marks it as downloaded.
+
+        The month is marked and its checkpoint spool removed only after the savers
+        succeeded; a saver error (e.g. WriteError) is recorded as a failed attempt and
+        raised before that.
+
+        Args:
+            clear_data (pd.DataFrame): Transformed data.
+            year (str): Year of the data.
+            month (str): Month of the data.
+        """
+        if self.keep_results:
+            self.stopy_bezrobocia.setdefault(year, {})[month] = clear_data
+        try:
+            for saver in self.savers:
+                saver.save_dataframe(clear_data, month, year)
+        except Exception:
+            self.record_failure(year, month)
+            raise
+        metrics.inc("months_loaded_total")
+        if self.checkpoints is not None:
+            self.checkpoints.discard(self.api.get_variable_id(month), year)
+        if self.date_range and (year, month) not in self.tracked_months:
+            ## range months outside the state are added, so they are skipped by the next plans
+            self.configManager.add_year("config.json", year)
+            self.tracked_months.update((year, str(m).zfill(2)) for m in range(1, 13))
+        if self.config or (year, month) in self.tracked_months:
+            self.configManager.update_config(
+                "config.json",
+                year,
+                month,
+                True,
+                row_count=len(clear_data),
+                content_hash=self.saver.last_content_hash,
+            )
+        if self.config:
+            self.configManager.check_all_data_downloaded("config.json")
+
+    def plan_date_range(self, start, end):
+        """
+        Builds the work queue of a date range.
+
+        Months marked as downloaded in config.json (or state.db) are skipped. Saved months
+        are marked there, a year missing from the state is added first. The queue starts
+        with the newest month, so fresh data is saved first.
+
+        Args:
+            start (str): The first month, YYYY-MM.
+            end (str, optional): The last month, YYYY-MM. Defaults to None (the current
+                month, taken again on every call, so the service mode plans new months).
+
+        Returns:
+            dict: Years as keys and month lists as values, both from the newest one.
+        """
+        state = {}
+        if os.path.exists("config.json") or not isinstance(self.configManager, ConfigManager):
+            try:
+                self.configManager.load_config("config.json")
+                state = self.configManager.get_value("Year") or {}
+            except (OSError, ValueError):
+                self.logger.warning(
+                    "The download state couldn't be read, no month is skipped", exc_info=1
+                )
+        downloaded = set()
+        for year, year_data in state.items():
+            for month, month_downloaded in year_data["Months"].items():
+                self.tracked_months.add((year, month))
+                if month_downloaded:
+                    downloaded.add((year, month))
+
+        key_dict = {}
+        end = end or date.today().strftime("%Y-%m")
+        if start > end:
+            return key_dict
+        for year, month in reversed(month_range(start, end)):
+            if (year, month) not in downloaded:
+                key_dict.setdefault(year, []).append(month)
+        return key_dict
+
+    def plan(self):
+        """
+        Returns the work queue and the estimated number of API requests, without downloading.
+
+        Every crawl of a month needs about UNITS_PER_MONTH / PAGE_SIZE pages; with the batch
+        mode a month is crawled once for all years. The probe adds one request per month and
+        cached pages or resumed crawls need fewer requests.
+
+        Returns:
+            dict: months, crawls, estimated_requests and the queue (years and month lists).
+        """
+        key_dict = self.GetDictYearMonthToDownload()
+        months = sum(len(month_list) for month_list in key_dict.values())
+        if self.batch:
+            crawls = len({month for month_list in key_dict.values() for month in month_list})
+        else:
+            crawls = months
+        requests = crawls * math.ceil(UNITS_PER_MONTH / PAGE_SIZE)
+        if self.probe is not None:
+            requests += months
+        return {
+            "months": months,
+            "crawls": crawls,
+            "estimated_requests": requests,
+            "queue": key_dict,
+        }
 
     def GetDictYearMonthToDownload(self):
         """
         Determine the years and months for which data should be downloaded.
 
+        Returns:
+            dict: A dictionary with years as keys and corresponding month lists as values,
+                empty if there is nothing to download.
+        """
+        key_dict = self.pending_months()
+        if not key_dict:
+            ## e.g. a re-run of a finished date range, which is not an error
+            self.logger.info("There is no data to download, all the requested months are saved")
+            return {}
+        self.logger.info(
+            "data for the following years and months will be downloaded:\n %s",
+            LazyJson(key_dict, indent=4),
+        )
+        return key_dict
+
+    def pending_months(self):
+        """
+        Returns the years and months which are not downloaded yet, without logging them.
+
         Returns:
             dict: A dictionary with years as keys and corresponding month lists as values.
         """
@@ -67,6 +551,8 @@ class UnemploymentDownloader:
                     "Error while trying read confing.json", stack_info=True
                 )
             key_dict = self.configManager.get_download_options()
+        elif self.date_range:
+            key_dict = self.plan_date_range(*self.date_range)
         else:
             if self.month is None:
                 self.month = [
@@ -86,12 +572,4 @@ class UnemploymentDownloader:
             if not isinstance(self.month, list):
                 self.month = [self.month]
             key_dict = {self.year: self.month}
-        try:
-            if not key_dict:
-                raise ValueError("No data to downlaod")
-            self.logger.info(
-                f"data for the following years and months will be downloaded:\n {json.dumps(key_dict, indent=4)}"
-            )
-            return key_dict
-        except:
-            self.logger.error("No data to download", exc_info=1)
+        return key_dict
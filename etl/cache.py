@@ -0,0 +1,292 @@
+#########################################################
+## Podręczna pamięć (cache) odpowiedzi z API na dysku ##
+#########################################################
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of API responses.
+
+    Entries are keyed by URL and X-ClientId. Every entry keeps the body and the
+    ETag / Last-Modified validators, which are sent back as If-None-Match /
+    If-Modified-Since so an unchanged page costs a 304 response. When the total
+    size exceeds max_size the least recently used entries are removed. The index is
+    written to disk every SAVE_EVERY new entries and by save_index() at the end of a run.
+    Bodies missing from the index (e.g. after a crash) are removed when it is loaded.
+
+    Args:
+        folder (str): Cache folder. Defaults to 'cache'.
+        max_size (int): Maximum size of the cached bodies in bytes. Defaults to 100 MB.
+
+    Attributes:
+        hits (int): Responses served from the cache (fresh or revalidated with 304).
+        misses (int): Responses downloaded from the API.
+        evictions (int): Entries removed because of the size cap.
+    """
+
+    INDEX_FILE = "index.json"
+    SAVE_EVERY = 500
+
+    def __init__(self, folder="cache", max_size=100 * 1024 * 1024):
+        self.folder = folder
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("__main__")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.index = self._load_index()
+        self.size = sum(entry["size"] for entry in self.index.values())
+        self.unsaved = 0
+
+    @staticmethod
+    def make_key(url, client_id):
+        """
+        Returns the cache key for a URL and client id.
+        """
+        return hashlib.sha256(f"{client_id or ''}|{url}".encode("UTF-8")).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def _load_index(self):
+        index_path = os.path.join(self.folder, self.INDEX_FILE)
+        index = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, encoding="UTF-8") as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                self.logger.warning("The cache index is damaged, the cache will be rebuilt")
+        self._remove_orphans(index)
+        return index
+
+    def _remove_orphans(self, index):
+        ## bodies stored after the last index write are not counted by the size cap,
+        ## so they are removed, together with entries whose body is gone
+        if not os.path.exists(self.folder):
+            return
+        bodies = set()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if not (re.fullmatch(r"[0-9a-f]{2}", name) and os.path.isdir(path)):
+                continue
+            for file_name in os.listdir(path):
+                if file_name in index:
+                    bodies.add(file_name)
+                    continue
+                try:
+                    os.remove(os.path.join(path, file_name))
+                except OSError:
+                    pass
+        for key in [key for key in index if key not in bodies]:
+            del index[key]
+
+    def save_index(self):
+        """
+        Writes the index of cached entries to disk.
+        """
+        with self.lock:
+            self._save_index()
+
+    def _save_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        index_path = os.path.join(self.folder, self.INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, index_path)
+        self.unsaved = 0
+
+    def conditional_headers(self, url, client_id):
+        """
+        Returns the validators to send with a request for a cached URL.
+
+        Args:
+            url (str): The request URL.
+            client_id (str): Client id used for the request.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if the URL is not cached.
+        """
+        with self.lock:
+            entry = self.index.get(self.make_key(url, client_id))
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get_fresh(self, url, client_id):
+        """
+        Returns a cached response that is still fresh according to Cache-Control max-age.
+
+        Args:
+            url (str): The request URL.
+            client_id (str): Client id used for the request.
+
+        Returns:
+            requests.Response: The cached response, or None if it has to be revalidated.
+        """
+        key = self.make_key(url, client_id)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or time.time() > entry.get("expires", 0):
+                return None
+        response = self._build_response(key, url)
+        if response is not None:
+            with self.lock:
+                self.hits += 1
+        return response
+
+    def handle(self, url, client_id, response):
+        """
+        Stores a 200 response or replaces a 304 response with the cached one.
+
+        Args:
+            url (str): The request URL.
+            client_id (str): Client id used for the request.
+            response (requests.Response): Response received from the API.
+
+        Returns:
+            requests.Response: The response to use.
+        """
+        key = self.make_key(url, client_id)
+        if response.status_code == 304:
+            cached = self._build_response(key, url)
+            if cached is not None:
+                with self.lock:
+                    self.hits += 1
+                    if key in self.index:
+                        self.index[key]["expires"] = self._expires(response)
+                return cached
+            return response
+        with self.lock:
+            self.misses += 1
+        if response.status_code == 200:
+            self._store(key, url, response)
+        return response
+
+    def _expires(self, response):
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        return time.time() + int(match.group(1)) if match else 0
+
+    def _store(self, key, url, response):
+        if not (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            if not self._expires(response):
+                return
+        body = response.content
+        body_path = self._body_path(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, body_path)
+        with self.lock:
+            old_entry = self.index.get(key)
+            if old_entry is not None:
+                self.size -= old_entry["size"]
+            self.index[key] = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": response.headers.get("Content-Type"),
+                "size": len(body),
+                "last_access": time.time(),
+                "expires": self._expires(response),
+            }
+            self.size += len(body)
+            self._evict()
+            ## the index is written in batches, not after every page
+            self.unsaved += 1
+            if self.unsaved >= self.SAVE_EVERY:
+                self._save_index()
+
+    def _build_response(self, key, url):
+        ## requests is imported here, so --clear_cache starts without loading it
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        try:
+            with open(self._body_path(key), "rb") as f:
+                body = f.read()
+        except OSError:
+            with self.lock:
+                entry = self.index.pop(key, None)
+                if entry is not None:
+                    self.size -= entry["size"]
+            return None
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            entry["last_access"] = time.time()
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.url = url
+        response.encoding = "UTF-8"
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": entry.get("content_type") or "application/json"}
+        )
+        return response
+
+    def _evict(self):
+        if self.size <= self.max_size:
+            return
+        for key in sorted(self.index, key=lambda k: self.index[k]["last_access"]):
+            if self.size <= self.max_size:
+                break
+            self.size -= self.index.pop(key)["size"]
+            self.evictions += 1
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Removes all cached entries.
+
+        Only the response bodies and the index are removed; other files in the folder,
+        e.g. the checkpoint spool and the probe answers, are kept.
+        """
+        with self.lock:
+            self.index = {}
+            self.size = 0
+            self.unsaved = 0
+            if os.path.exists(self.folder):
+                for name in os.listdir(self.folder):
+                    path = os.path.join(self.folder, name)
+                    if name.startswith(self.INDEX_FILE):
+                        os.remove(path)
+                    elif re.fullmatch(r"[0-9a-f]{2}", name) and os.path.isdir(path):
+                        shutil.rmtree(path)
+        self.logger.info(f"The response cache in '{self.folder}' has been cleared")
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions and the number of cached entries.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.index),
+            }
@@ -0,0 +1,129 @@
+################################################################
+## Zapis postępu pobierania stron (wznawianie przerwanych pobrań) ##
+################################################################
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from etl.decode import UnitColumns
+from etl.metrics import metrics
+
+
+class CheckpointSpool:
+    """
+    Local spool of downloaded pages, so an interrupted crawl resumes from the last finished page.
+
+    Every page of a (variable, year) crawl is written to its own file, followed by a
+    state file with the URL of the next page. A rerun reads the spooled pages and
+    continues from that URL. The spool of a month is removed once the month is saved.
+
+    Args:
+        folder (str): Spool folder. Defaults to 'cache/spool'.
+        ttl (int): Age in seconds after which a spool is not resumed. Defaults to 24 hours.
+    """
+
+    STATE_FILE = "state.json"
+
+    def __init__(self, folder=os.path.join("cache", "spool"), ttl=24 * 3600):
+        self.folder = folder
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("__main__")
+        self.created = {}
+
+    def _crawl_folder(self, variable_id, year):
+        return os.path.join(self.folder, f"{variable_id}_{year}")
+
+    @staticmethod
+    def _write_atomic(path, write):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def resume(self, variable_id: str, year: str):
+        """
+        Reads the spooled pages of a crawl.
+
+        Args:
+            variable_id (str): The variable ID.
+            year (str): The year.
+
+        Returns:
+            tuple: URL of the next page (None if the crawl was finished) and the list of
+                UnitColumns of the spooled pages, or None if there is nothing to resume.
+        """
+        folder = self._crawl_folder(variable_id, year)
+        state_path = os.path.join(folder, self.STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, encoding="UTF-8") as f:
+                state = json.load(f)
+            if time.time() - state["created"] > self.ttl:
+                self.logger.info(f"The spool '{folder}' is outdated and will be removed")
+                self.discard(variable_id, year)
+                return None
+            pages = []
+            for number in range(state["pages"]):
+                with np.load(os.path.join(folder, f"page-{number:05d}.npz")) as page:
+                    pages.append(
+                        UnitColumns.from_lists(page["id"], page["name"].tolist(), page["stopa"])
+                    )
+        except (OSError, ValueError, KeyError):
+            self.logger.warning(f"The spool '{folder}' is damaged and will be removed")
+            self.discard(variable_id, year)
+            return None
+
+        with self.lock:
+            self.created[(variable_id, year)] = state["created"]
+        metrics.inc("checkpoint_pages_resumed_total", len(pages))
+        self.logger.info(
+            f"Resuming variable {variable_id} for the year {year} after {len(pages)} spooled pages"
+        )
+        return state["next_url"], pages
+
+    def save_page(self, variable_id: str, year: str, number: int, columns: UnitColumns, next_url):
+        """
+        Writes a downloaded page and the URL of the next page.
+
+        Args:
+            variable_id (str): The variable ID.
+            year (str): The year.
+            number (int): Zero-based number of the page.
+            columns (UnitColumns): Columns of the page.
+            next_url (str): URL of the next page, or None on the last page.
+        """
+        folder = self._crawl_folder(variable_id, year)
+        os.makedirs(folder, exist_ok=True)
+        with self.lock:
+            if number == 0:
+                self.created[(variable_id, year)] = time.time()
+            created = self.created.setdefault((variable_id, year), time.time())
+
+        ## the page is written first, so the state never points to a missing page
+        self._write_atomic(
+            os.path.join(folder, f"page-{number:05d}.npz"),
+            lambda f: np.savez(
+                f, id=columns.id, name=columns.name.astype(str), stopa=columns.stopa
+            ),
+        )
+        state = {"next_url": next_url, "pages": number + 1, "created": created}
+        self._write_atomic(
+            os.path.join(folder, self.STATE_FILE),
+            lambda f: f.write(json.dumps(state).encode("UTF-8")),
+        )
+
+    def discard(self, variable_id: str, year: str):
+        """
+        Removes the spool of a crawl.
+        """
+        with self.lock:
+            self.created.pop((variable_id, year), None)
+        shutil.rmtree(self._crawl_folder(variable_id, year), ignore_errors=True)
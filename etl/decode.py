@@ -0,0 +1,190 @@
+#################################################
+## Dekodowanie stron odpowiedzi API BDL (JSON) ##
+#################################################
+
+import json
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+## orjson and ujson are optional, faster drop-in replacements of json.loads
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+
+        loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        loads = json.loads
+        JSON_BACKEND = "json"
+
+
+ID_LENGTH = 12
+
+## unit names repeat in every month and year, one string object per name is kept here
+## (sys.intern would drop and re-add the names of every released month)
+NAME_CACHE = {}
+NAME_CACHE_SIZE = 100000
+
+
+class UnitColumns:
+    """
+    Columnar buffer of the units of a variable and year.
+
+    Ids are kept as a fixed-width unicode array, names as interned strings (the same
+    unit names repeat in every month and year) and rates as a float array, so a page
+    costs three arrays instead of a dictionary per unit.
+
+    Args:
+        ids (np.ndarray): Unit ids, dtype U12.
+        names (np.ndarray): Unit names, dtype object.
+        values (np.ndarray): Rates, dtype float64 (NaN for missing values).
+    """
+
+    __slots__ = ("id", "name", "stopa")
+
+    def __init__(self, ids, names, values):
+        self.id = ids
+        self.name = names
+        self.stopa = values
+
+    @classmethod
+    def from_lists(cls, ids, names, values):
+        """
+        Builds the buffer from lists of ids, names and values.
+        """
+        if len(NAME_CACHE) > NAME_CACHE_SIZE:
+            NAME_CACHE.clear()
+        name_array = np.empty(len(names), dtype=object)
+        name_array[:] = [NAME_CACHE.setdefault(name, name) for name in names]
+        return cls(
+            np.array(ids, dtype=f"U{ID_LENGTH}"),
+            name_array,
+            np.array(values, dtype=np.float64),
+        )
+
+    @classmethod
+    def concat(cls, chunks):
+        """
+        Joins buffers, e.g. the pages of a variable and year, into one buffer.
+        """
+        chunks = list(chunks)
+        if len(chunks) == 1:
+            return chunks[0]
+        if not chunks:
+            return cls.from_lists([], [], [])
+        return cls(
+            np.concatenate([chunk.id for chunk in chunks]),
+            np.concatenate([chunk.name for chunk in chunks]),
+            np.concatenate([chunk.stopa for chunk in chunks]),
+        )
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def nbytes(self):
+        """
+        Size of the arrays in bytes (the interned names are counted as pointers).
+        """
+        return self.id.nbytes + self.name.nbytes + self.stopa.nbytes
+
+
+Page = namedtuple("Page", ["valid", "next_url", "total_records", "columns"])
+Page.__doc__ = """
+Decoded page of a by-Variable response.
+
+Attributes:
+    valid (bool): True if the page has results.
+    next_url (str): URL of the next page, or None on the last page.
+    total_records (int): Number of records of the whole crawl, or None if not sent.
+    columns (UnitColumns | dict): Columns of the page, or years as keys and UnitColumns
+        as values when decoded by year.
+"""
+
+
+def _check_id(unit_id):
+    if not unit_id or len(unit_id) != ID_LENGTH:
+        logging.error("Something problem with ID column during extract data")
+        raise ValueError("Id can't be None and should have 12 chars")
+    return unit_id
+
+
+def project_columns(results):
+    """
+    Keeps the id, name and the value of the first year of every result.
+
+    Args:
+        results (list): The results of a page.
+
+    Returns:
+        UnitColumns: Columns of the page.
+
+    Raises:
+        ValueError: If an ID is missing or doesn't have 12 characters.
+    """
+    ids = []
+    names = []
+    values = []
+    for row in results:
+        ids.append(_check_id(row["id"]))
+        names.append(row["name"])
+        values.append(row["values"][0]["val"])
+    return UnitColumns.from_lists(ids, names, values)
+
+
+def project_columns_by_year(results):
+    """
+    Keeps the id, name and the value of every year of every result.
+
+    Args:
+        results (list): The results of a page.
+
+    Returns:
+        dict: Years as keys and UnitColumns as values.
+
+    Raises:
+        ValueError: If an ID is missing or doesn't have 12 characters.
+    """
+    columns = {}
+    for row in results:
+        unit_id = _check_id(row["id"])
+        for value in row["values"]:
+            year_columns = columns.get(str(value["year"]))
+            if year_columns is None:
+                year_columns = columns[str(value["year"])] = ([], [], [])
+            year_columns[0].append(unit_id)
+            year_columns[1].append(row["name"])
+            year_columns[2].append(value["val"])
+    return {year: UnitColumns.from_lists(*lists) for year, lists in columns.items()}
+
+
+def decode_page(content, by_year=False):
+    """
+    Parses a page body once and projects the results into columns.
+
+    Args:
+        content (bytes): The response body.
+        by_year (bool, optional): Split the values per year (batch crawls). Defaults to False.
+
+    Returns:
+        Page: Validity, next link, record count and the columns of the page.
+
+    Raises:
+        ValueError: If the body isn't valid JSON or an ID is invalid.
+    """
+    data = loads(content)
+    results = data.get("results") or []
+    next_url = (data.get("links") or {}).get("next") or None
+    if by_year:
+        columns = project_columns_by_year(results)
+    else:
+        columns = project_columns(results)
+    return Page(bool(results), next_url, data.get("totalRecords"), columns)
+
@@ -4,10 +4,31 @@
 
 
 ## import packages
+import asyncio
+import itertools
 import logging
+import math
 import os
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
+from etl.cache import ResponseCache
+from etl.checkpoint import CheckpointSpool
+from etl.decode import Page, UnitColumns, decode_page
+from etl.metrics import metrics
+from etl.ratelimit import RateLimiter, parse_client_ids, parse_retry_after
+from etl.retry import CircuitBreaker, RetryPolicy
+from etl.transport import Transport
+
+## the bdlApiUrl variable allows to point the client to another server, e.g. a local mock
+BDL_API_URL = os.getenv("bdlApiUrl", "https://bdl.stat.gov.pl/api/v1")
+PAGE_SIZE = 100
+
+
+class IncompleteDataError(Exception):
+    """
+    Raised when a page in the middle of the data has no results.
+    """
 
 
 class Extractor:
@@ -16,17 +37,32 @@ class Extractor:
 
     Methods:
         get_variable_id(): Retrieves the variable ID for a given month.
+        iter_pages(): Yields the columns of a variable and year page by page.
+        stream_data(): Returns a lazy iterator over the pages of a variable and year.
         fetch_data(): Fetches data from the API for a specific variable and year.
-        get_next_page(): Retrieves the URL for the next page of results.
+        fetch_data_async(): Fetches all pages concurrently using asyncio.
+        fetch_data_batch(): Fetches data for several years in one crawl.
 
     Raises:
         ValueError: If an invalid month is provided.
         requests.exceptions.RequestException: If there is a problem with the internet connection.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        cache: ResponseCache = None,
+        checkpoints: CheckpointSpool = None,
+        pool_size: int = 10,
+    ):
         """
         Initializes the Api instance.
+
+        Args:
+            cache (ResponseCache, optional): On-disk response cache. Defaults to None (no cache).
+            checkpoints (CheckpointSpool, optional): Spool of downloaded pages used to resume
+                interrupted crawls. Defaults to None (no checkpoints).
+            pool_size (int, optional): Pooled connections to the API, the number of concurrent
+                requests. Defaults to 10.
         """
         self.VARIABLE_ID_MAP = {
             "01": "461680",
@@ -43,8 +79,11 @@ class Extractor:
             "12": "461691",
         }
         self.logger = logging.getLogger("__main__")
-        self.request_handler = RequestHandler()
-        self.header_builder = HeaderBuilder(os.getenv("X-ClientId", None))
+        ## X-ClientId may hold several keys separated by commas, they are used by the rate limiter
+        self.rate_limiter = RateLimiter(parse_client_ids(os.getenv("X-ClientId", None)))
+        self.transport = Transport(pool_size)
+        self.request_handler = RequestHandler(self.rate_limiter, cache, transport=self.transport)
+        self.checkpoints = checkpoints
 
     def get_variable_id(self, month):
         """
@@ -64,6 +103,111 @@ class Extractor:
             raise ValueError("Invalid month")
         return self.VARIABLE_ID_MAP[month_str]
 
+    def build_url(
+        self, variable_id: str, year: str, page: int = None, page_size: int = PAGE_SIZE
+    ):
+        """
+        Builds the by-Variable URL for a specific variable, year and page.
+
+        Args:
+            variable_id (str): The variable ID.
+            year (str | list): The year, or a list of years requested in one crawl.
+            page (int, optional): Zero-based page number. Defaults to None (first page).
+            page_size (int, optional): Number of results per page. Defaults to PAGE_SIZE.
+
+        Returns:
+            str: The request URL.
+        """
+        years = year if isinstance(year, (list, tuple)) else [year]
+        year_query = "&".join(f"year={y}" for y in years)
+        url = f"{BDL_API_URL}/data/by-Variable/{variable_id}?{year_query}&format=json&page-size={page_size}"
+        if page is not None:
+            url += f"&page={page}"
+        return url
+
+    def iter_pages(self, variable_id: str, year: str):
+        """
+        Fetches the pages of a variable and year one by one, yielding the columns of each page.
+
+        With checkpoints every page is spooled before it is yielded, and a crawl with a
+        spool starts with the spooled pages and continues from the next page URL.
+
+        Args:
+            variable_id (str): The variable ID for which the data is to be fetched.
+            year (str): The year for which the data is to be fetched.
+
+        Yields:
+            UnitColumns: The id, name and stopa columns of one page.
+
+        Raises:
+            IncompleteDataError: If a page after the first one has no results.
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
+        """
+        ## only the time spent here is measured, not the consumer's time between the pages
+        elapsed = 0.0
+        starttime = time.perf_counter()
+        try:
+            url = self.build_url(variable_id, year)
+            number = 0
+            if self.checkpoints is not None:
+                checkpoint = self.checkpoints.resume(variable_id, year)
+                if checkpoint is not None:
+                    url, pages = checkpoint
+                    for number, columns in enumerate(pages, start=1):
+                        elapsed += time.perf_counter() - starttime
+                        starttime = None
+                        yield columns
+                        starttime = time.perf_counter()
+
+            while url:
+                response = self.get_response(url)
+                page = self.request_handler.read_page(response)
+
+                if page.valid:
+                    url = page.next_url
+                    self.logger.info("Download completed successfully")
+                    if self.checkpoints is not None:
+                        self.checkpoints.save_page(variable_id, year, number, page.columns, url)
+                    elapsed += time.perf_counter() - starttime
+                    starttime = None
+                    yield page.columns
+                    starttime = time.perf_counter()
+                elif number == 0:
+                    return
+                else:
+                    if self.checkpoints is not None:
+                        self.checkpoints.discard(variable_id, year)
+                    raise IncompleteDataError(
+                        f"Page without results in the middle of the data: {url}"
+                    )
+                number += 1
+        finally:
+            if starttime is not None:
+                elapsed += time.perf_counter() - starttime
+            metrics.observe("extract", elapsed, method="iter_pages")
+
+    def stream_data(self, variable_id: str, year: str):
+        """
+        Fetches the first page and returns an iterator over all pages of a variable and year.
+
+        The remaining pages are downloaded while the iterator is consumed.
+
+        Args:
+            variable_id (str): The variable ID for which the data is to be fetched.
+            year (str): The year for which the data is to be fetched.
+
+        Returns:
+            iterator: Iterator over the UnitColumns of the pages, or None if the API has no data.
+
+        Raises:
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
+        """
+        pages = self.iter_pages(variable_id, year)
+        first = next(pages, None)
+        if first is None:
+            return None
+        return itertools.chain([first], pages)
+
     def fetch_data(self, variable_id: str, year: str):
         """
         Fetches data from the API for a specific variable and year.
@@ -73,103 +217,310 @@ class Extractor:
             year (str): The year for which the data is to be fetched.
 
         Returns:
-            list: A list of dictionaries containing the fetched data.
+            UnitColumns: The fetched data, or None if the API has no data.
 
         Raises:
             requests.exceptions.RequestException: If there is a problem with the internet connection.
         """
-        stopa = []
-        url = f"https://bdl.stat.gov.pl/api/v1/data/by-Variable/{variable_id}?year={year}&format=json&page-size=100"
-        header = self.header_builder.build_header()
-        starttime = time.time()
-        while url:
-            try:
-                self.logger.info(f"Start trying to download data from the URL: {url}")
-                response = self.request_handler.get(url, header)
-            except requests.exceptions.RequestException:
-                self.logger.error(
-                    f"Problem with the internet connection:\n", exc_info=1
-                )
-                self.logger.info(
-                    "No internet connection. Pausing data fetching. Will trying again at 30 sec"
-                )
-                time.sleep(30)
-                if time.time() - starttime > 180:
-                    self.logger.critical(
-                        "after 3 minutes of reconnection attempts, the program ended",
-                        stack_info=True,
+        ## the extract time is recorded by iter_pages
+        try:
+            pages = list(self.iter_pages(variable_id, year))
+        except IncompleteDataError:
+            return None
+        if not pages:
+            return None
+        return UnitColumns.concat(pages)
+
+    def fetch_data_async(self, variable_id: str, year: str, max_in_flight: int = 4):
+        """
+        Fetches data from the API for a specific variable and year, downloading pages concurrently.
+
+        The first page is fetched on its own; its totalRecords value is used to plan the
+        URLs of the remaining pages, which are then fetched with at most max_in_flight
+        requests in progress. Rows are returned in the same order as fetch_data.
+
+        Args:
+            variable_id (str): The variable ID for which the data is to be fetched.
+            year (str): The year for which the data is to be fetched.
+            max_in_flight (int, optional): Maximum number of concurrent requests. Defaults to 4.
+
+        Returns:
+            UnitColumns: The fetched data, or None if the API has no data.
+
+        Raises:
+            IncompleteDataError: If a page after the first one has no results.
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
+        """
+        with metrics.time("extract", method="fetch_data_async"):
+            return self._fetch_data_async(variable_id, year, max_in_flight)
+
+    def _fetch_data_async(self, variable_id, year, max_in_flight):
+        url = self.build_url(variable_id, year)
+        response = self.get_response(url)
+        first_page = self.request_handler.read_page(response)
+        if not first_page.valid:
+            return None
+
+        stopa = [first_page.columns]
+        total_records = first_page.total_records
+        if total_records is None:
+            # Without the record count the pages can't be planned, follow the links instead
+            next_url = first_page.next_url
+            while next_url:
+                response = self.get_response(next_url)
+                page = self.request_handler.read_page(response)
+                if not page.valid:
+                    raise IncompleteDataError(
+                        f"Page without results in the middle of the data: {next_url}"
                     )
-                    raise requests.exceptions.RequestException
-                continue
-            except Exception as e:
-                self.logger.exception("Other exception while get data")
-
-            if self.request_handler.validate_response(response):
-                json = response.json()
-                url = self.get_next_page(json)
-                results = json["results"]
-                for row in results:
-                    try:
-                        if row["id"] and len(row["id"]) == 12:
-                            data_row = {
-                                "id": row["id"],
-                                "name": row["name"],
-                                "stopa": row["values"][0]["val"],
-                            }
-                            stopa.append(data_row)
-                        else:
-                            raise ValueError(
-                                "Id can't be None and should have 12 chars"
-                            )
-                    except:
-                        logging.error(
-                            "Something problem with ID column during extract data",
-                            exc_info=1,
-                        )
-                        raise
-
-                self.logger.info("Download completed successfully")
-            else:
-                return None
+                next_url = page.next_url
+                stopa.append(page.columns)
+            return UnitColumns.concat(stopa)
 
-            endtime = time.time()
-            if (endtime - starttime) < 0.1:
-                time.sleep(0.1)
+        urls = [
+            self.build_url(variable_id, year, page)
+            for page in range(1, math.ceil(total_records / PAGE_SIZE))
+        ]
+        loop = asyncio.new_event_loop()
+        try:
+            pages = loop.run_until_complete(
+                self._fetch_pages(loop, urls, max_in_flight)
+            )
+        finally:
+            loop.close()
 
-        return stopa
+        for url, page in zip(urls, pages):
+            if not page.valid:
+                raise IncompleteDataError(f"Page without results in the middle of the data: {url}")
+            stopa.append(page.columns)
+        self.logger.info(
+            f"Download of {len(urls) + 1} pages completed successfully"
+        )
+        return UnitColumns.concat(stopa)
 
-    def get_next_page(self, json: requests.Response):
+    def fetch_data_batch(self, variable_id: str, years: list):
         """
-        Retrieves the URL for the next page of results.
+        Fetches data from the API for a specific variable and several years in one crawl.
+
+        The by-Variable endpoint accepts many year parameters and returns the values of
+        all requested years for each unit, so the pages are crawled once and the rows
+        are split per year afterwards.
 
         Args:
-            json (requests.Response): The JSON response object.
+            variable_id (str): The variable ID for which the data is to be fetched.
+            years (list): The years for which the data is to be fetched.
 
         Returns:
-            str: The URL for the next page of results, or None if there is no next page.
+            dict: Years as keys and UnitColumns (as returned by fetch_data) as values.
+                Years without data are missing from the dictionary.
+
+        Raises:
+            IncompleteDataError: If a page after the first one has no results.
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
         """
-        next_page_url = json["links"].get("next")
-        if next_page_url:
-            url = next_page_url
-        else:
-            url = None
-        return url
+        stopa = {}
+        url = self.build_url(variable_id, list(years))
+        number = 0
+        with metrics.time("extract", method="fetch_data_batch"):
+            while url:
+                response = self.get_response(url)
+                page = self.request_handler.read_page(response, by_year=True)
+
+                if page.valid:
+                    url = page.next_url
+                    for year, columns in page.columns.items():
+                        stopa.setdefault(year, []).append(columns)
+                    self.logger.info("Download completed successfully")
+                elif number == 0:
+                    return {}
+                else:
+                    raise IncompleteDataError(
+                        f"Page without results in the middle of the data: {url}"
+                    )
+                number += 1
+
+        return {year: UnitColumns.concat(pages) for year, pages in stopa.items()}
+
+    async def _fetch_pages(self, loop, urls, max_in_flight):
+        """
+        Fetches the given URLs on a bounded thread pool and returns the decoded pages in URL order.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The event loop running the coroutine.
+            urls (list): Page URLs to fetch.
+            max_in_flight (int): Maximum number of concurrent requests.
+
+        Returns:
+            list: Decoded pages (Page).
+        """
+
+        def fetch_page(url):
+            response = self.get_response(url)
+            return self.request_handler.read_page(response)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+            tasks = [loop.run_in_executor(executor, fetch_page, url) for url in urls]
+            return await asyncio.gather(*tasks)
+
+    def get_response(self, url: str):
+        """
+        Sends a GET request. Timeouts, retries and the circuit breaker are handled by RequestHandler.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            requests.Response: The response object.
+
+        Raises:
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
+        """
+        self.logger.info("Start trying to download data from the URL: %s", url)
+        try:
+            return self.request_handler.get(url)
+        except requests.exceptions.RequestException:
+            self.logger.critical(
+                "The data couldn't be downloaded from the URL: %s", url, exc_info=1
+            )
+            raise
 
 
 class RequestHandler:
-    def __init__(self):
-        self.session = requests.Session()
+    MAX_RATE_LIMIT_RETRIES = 5
+
+    def __init__(
+        self,
+        rate_limiter: RateLimiter = None,
+        cache: ResponseCache = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        transport: Transport = None,
+    ):
+        self.transport = transport or Transport()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.logger = logging.getLogger("__main__")
+
+    def get(self, url):
+        """
+        Sends a GET request once the rate limiter allows it.
+
+        The X-ClientId header is taken from the limiter's key pool. Responses with
+        status 429 are repeated after the time given in Retry-After. Connection errors,
+        timeouts and 5xx responses are repeated with the backoff of the retry policy,
+        other 4xx responses are returned at once. With a cache, fresh cached pages are
+        returned without waiting for the rate limiter, the others are revalidated and
+        a 304 response is replaced by the cached body.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            requests.Response: The response object.
+
+        Raises:
+            requests.exceptions.RequestException: If the request still fails after the
+                retries, or the circuit breaker is open.
+        """
+        if self.cache is not None:
+            ## a fresh cached page doesn't use a token of the rate limiter
+            for client_id in self.rate_limiter.clients:
+                cached = self.cache.get_fresh(url, client_id)
+                if cached is not None:
+                    metrics.inc("http_requests_total", status="cached")
+                    return cached
+        starttime = time.monotonic()
+        failures = 0
+        rate_limited = 0
+        while True:
+            client_id = self.rate_limiter.acquire()
+            ## User-Agent, Accept-Encoding and keep-alive are the defaults of the Transport session,
+            ## the Host header is set by requests from the URL
+            request_header = {}
+            if client_id:
+                request_header["X-ClientId"] = client_id
+            if self.cache is not None:
+                request_header.update(self.cache.conditional_headers(url, client_id))
+            self.circuit_breaker.before_request()
+            try:
+                with metrics.time("http_request"):
+                    response = self.transport.get(
+                        url, headers=request_header, timeout=self.retry_policy.timeout
+                    )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                error = e
+                response = retry_after = None
+                reason = "connection"
+            else:
+                metrics.inc("http_requests_total", status=response.status_code)
+                metrics.inc("http_response_bytes_total", len(response.content))
+                if self.rate_limiter.observe(client_id, response):
+                    rate_limited += 1
+                    if rate_limited >= self.MAX_RATE_LIMIT_RETRIES:
+                        break
+                    metrics.inc("http_retries_total", reason="rate_limit")
+                    continue
+                if not self.retry_policy.is_retryable(response.status_code):
+                    self.circuit_breaker.record_success()
+                    break
+                error = None
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                reason = "status"
+
+            self.circuit_breaker.record_failure()
+            failures += 1
+            if (
+                failures >= self.retry_policy.max_attempts
+                or time.monotonic() - starttime > self.retry_policy.deadline
+            ):
+                if response is None:
+                    raise error
+                break
+            wait = self.retry_policy.wait_time(failures, retry_after)
+            self.logger.warning(
+                "Attempt %d of the request failed (%s), trying again in %.1f sec",
+                failures,
+                error if response is None else f"status {response.status_code}",
+                wait,
+            )
+            metrics.inc("http_retries_total", reason=reason)
+            metrics.inc("retry_sleep_seconds_total", wait)
+            time.sleep(wait)
+        if self.cache is not None:
+            response = self.cache.handle(url, client_id, response)
+        return response
+
+    def read_page(self, response: requests.Response, by_year: bool = False):
+        """
+        Checks the status of a response and decodes its body once.
 
-    def get(self, url, header):
-        return self.session.get(url=url, headers=header)
+        Args:
+            response (requests.Response): The response object.
+            by_year (bool, optional): Split the values per year (batch crawls). Defaults to False.
+
+        Returns:
+            Page: The decoded page, not valid if the response has no results.
 
-    def validate_response(self, response: requests.Response):
+        Raises:
+            requests.exceptions.HTTPError: If the response has an error status.
+            ValueError: If the body isn't valid JSON or an ID is invalid.
+        """
         if response.status_code != 200:
             response.raise_for_status()
-        elif not response.json().get("results"):
-            return False
-        else:
-            return True
+            return Page(False, None, None, {})
+        with metrics.time("json_decode"):
+            page = decode_page(response.content, by_year)
+        if page.valid:
+            columns = page.columns.values() if by_year else [page.columns]
+            metrics.inc("extract_pages_total")
+            metrics.inc("extract_rows_total", sum(len(column) for column in columns))
+        return page
 
     def check_internet_connection(self):
         try:
@@ -178,17 +529,3 @@ class RequestHandler:
         except requests.exceptions.RequestException:
             return False
 
-
-class HeaderBuilder:
-    def __init__(self, token):
-        self.token = token
-
-    def build_header(self):
-        header = {
-            "Host": "bdl.stat.gov.pl",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-        }
-        if self.token:
-            header["X-ClientId"] = self.token
-
-        return header
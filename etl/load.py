@@ -3,9 +3,44 @@
 ####################################
 
 import pandas as pd
+import hashlib
 import logging
 import os
+import sqlite3
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from etl.metrics import metrics
+
+
+class WriteError(OSError):
+    """
+    Raised when a CSV file couldn't be written to any output folder.
+    """
+
+
+TYPED_COLUMNS = {"WOJ.": "woj", "POW.": "pow", "name": "name", "stopa": "stopa"}
+
+
+def to_typed_frame(dataframe: pd.DataFrame):
+    """
+    Converts the transformed DataFrame to typed columns.
+
+    Args:
+        dataframe (pd.DataFrame): Transformed DataFrame.
+
+    Returns:
+        pd.DataFrame: DataFrame with woj, pow and name as strings and stopa as float.
+
+    """
+    typed = dataframe[list(TYPED_COLUMNS)].rename(columns=TYPED_COLUMNS)
+    for column in ["woj", "pow", "name"]:
+        typed[column] = typed[column].astype(str)
+    typed["stopa"] = pd.to_numeric(
+        typed["stopa"].astype(str).str.replace(",", ".", regex=False),
+        errors="coerce",
+    ).astype("float64")
+    return typed.reset_index(drop=True)
 
 
 class FileManager:
@@ -78,6 +113,48 @@ class FileManager:
 
         os.remove(file_path)
 
+    def file_hash(self, file_path):
+        """
+        Calculates the SHA-256 hash of the file content.
+
+        Args:
+            file_path (str): File path.
+
+        Returns:
+            str: Hex digest of the file content.
+
+        """
+
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def write_file_atomic(self, file_path, content):
+        """
+        Writes the content to a temporary file and renames it to the target path,
+        so readers never see a partially written file.
+
+        Args:
+            file_path (str): File path.
+            content (bytes): File content.
+
+        """
+
+        folder, file_name = os.path.split(file_path)
+        tmp_path = os.path.join(folder, f".{file_name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def create_file_name(self, month, year):
         """
         Creates a file name based on the month and year.
@@ -100,34 +177,60 @@ class CsvSaver:
 
     Args:
         file_manager (FileManager): Instance of FileManager for file management.
+        overwrite (str): Policy for existing files: 'ask' (prompt for 60 seconds),
+            'always', 'never' or 'if-changed' (skip files with identical content).
+            Defaults to 'ask'.
 
     Attributes:
         file_manager (FileManager): Instance of FileManager for file management.
+        overwrite (str): Policy for existing files.
+        failed_writes (dict): File paths that couldn't be written, with their content.
+        last_content_hash (str): SHA-256 hash of the last saved CSV content.
         logger (logging.Logger): Logger instance.
 
     """
 
-    def __init__(self, file_manager: FileManager):
+    OVERWRITE_POLICIES = ["ask", "always", "never", "if-changed"]
+    WRITE_ATTEMPTS = 3
+    RETRY_DELAY = 2
+
+    def __init__(self, file_manager: FileManager, overwrite: str = "ask"):
+        if overwrite not in self.OVERWRITE_POLICIES:
+            raise ValueError(
+                f"Invalid overwrite policy '{overwrite}'. Use one of: {self.OVERWRITE_POLICIES}"
+            )
         self.file_manager = file_manager
+        self.overwrite = overwrite
+        self.failed_writes = {}
+        self.last_content_hash = None
         self.logger = logging.getLogger("__main__")
 
     def save_dataframe(self, dataframe: pd.DataFrame, month: str, year: str):
         """
-        Saves a DataFrame as a CSV file.
+        Saves a DataFrame as a CSV file in every output folder.
+
+        The DataFrame is serialized once and the content is written to all output
+        folders concurrently. A folder that fails is retried on its own and, if it
+        still fails, kept in failed_writes for retry_failed_writes().
 
         Args:
             dataframe (pd.DataFrame): DataFrame to be saved.
             month (str): Month for generate the name.
             year (str): Year for generate the name.
 
+        Returns:
+            dict: File paths as keys and (status, seconds, error) tuples as values.
+
+        Raises:
+            WriteError: If the file couldn't be written to any output folder.
+
         """
 
         if dataframe.empty:
             self.logger.warning("Dataframe is empty. File not saved.")
-            return
+            return {}
 
-        # Create the output directory if it doesn't exist
-        self.file_manager.create_directories()
+        starttime = time.perf_counter()
 
         # Generate the file name based on the month and year
         file_name = self.file_manager.create_file_name(month, year)
@@ -135,6 +238,192 @@ class CsvSaver:
         # Get the full file path
         file_paths = self.file_manager.get_file_paths(file_name)
 
+        # Serialize the DataFrame once for all output folders
+        content = self.serialize(dataframe)
+        content_hash = hashlib.sha256(content).hexdigest()
+        self.last_content_hash = content_hash
+
+        # Decide about existing files first, the 'ask' policy prompts the user one by one
+        results = {}
+        to_write = []
+        for file_path in file_paths:
+            if self.file_manager.file_exists(file_path) and not self.should_overwrite(
+                file_path, content_hash
+            ):
+                results[file_path] = ("skipped", 0.0, None)
+                metrics.inc("load_files_total", status="skipped")
+            else:
+                to_write.append(file_path)
+
+        results.update(self.write_to_destinations(to_write, content))
+        metrics.observe("load", time.perf_counter() - starttime, saver="csv")
+        if results and all(status == "failed" for status, _, _ in results.values()):
+            ## nothing was written, the month is not marked as downloaded and is redone
+            ## on the next run, so the files are not kept for retry_failed_writes()
+            for file_path in results:
+                self.failed_writes.pop(file_path, None)
+            errors = "; ".join(f"{path}: {error}" for path, (_, _, error) in results.items())
+            raise WriteError(f"File '{file_name}' couldn't be saved to any output folder: {errors}")
+        return results
+
+    def write_to_destinations(self, file_paths, content):
+        """
+        Writes the same content to several file paths concurrently.
+
+        Args:
+            file_paths (list): Target file paths.
+            content (bytes): File content.
+
+        Returns:
+            dict: File paths as keys and (status, seconds, error) tuples as values.
+
+        """
+
+        if not file_paths:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(file_paths)) as executor:
+            results = dict(
+                zip(
+                    file_paths,
+                    executor.map(
+                        lambda path: self.write_to_destination(path, content),
+                        file_paths,
+                    ),
+                )
+            )
+        for file_path, (status, seconds, error) in results.items():
+            metrics.inc("load_files_total", status=status)
+            if status == "failed":
+                self.failed_writes[file_path] = content
+            else:
+                metrics.inc("load_bytes_total", len(content))
+                self.failed_writes.pop(file_path, None)
+        return results
+
+    def write_to_destination(self, file_path, content):
+        """
+        Writes the content to a single file path, retrying after a failure.
+
+        Args:
+            file_path (str): Target file path.
+            content (bytes): File content.
+
+        Returns:
+            tuple: Status ('saved' or 'failed'), duration in seconds and the last error.
+
+        """
+
+        starttime = time.time()
+        error = None
+        for attempt in range(1, self.WRITE_ATTEMPTS + 1):
+            try:
+                # Create the output directory if it doesn't exist
+                os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+                self.file_manager.write_file_atomic(file_path, content)
+                duration = time.time() - starttime
+                self.logger.info(
+                    "Dataframe saved successfully to the path: '%s' in %.2f sec.",
+                    file_path,
+                    duration,
+                )
+                return ("saved", duration, None)
+            except OSError as e:
+                error = e
+                self.logger.warning(
+                    f"Attempt {attempt} of writing the file '{file_path}' failed: {e}"
+                )
+                if attempt < self.WRITE_ATTEMPTS:
+                    metrics.inc("load_retries_total")
+                    metrics.inc("retry_sleep_seconds_total", self.RETRY_DELAY * attempt)
+                    time.sleep(self.RETRY_DELAY * attempt)
+        duration = time.time() - starttime
+        self.logger.error(
+            f"File '{file_path}' not saved after {self.WRITE_ATTEMPTS} attempts: {error}"
+        )
+        return ("failed", duration, error)
+
+    def retry_failed_writes(self):
+        """
+        Writes again the files that failed during the run, without transforming the data again.
+
+        Returns:
+            dict: File paths as keys and (status, seconds, error) tuples as values.
+
+        """
+
+        if not self.failed_writes:
+            return {}
+        failed = dict(self.failed_writes)
+        self.logger.info(f"Retrying {len(failed)} failed file writes")
+        results = {}
+        for file_path, content in failed.items():
+            results.update(self.write_to_destinations([file_path], content))
+        return results
+
+    def serialize(self, dataframe: pd.DataFrame):
+        """
+        Serializes a DataFrame to CSV bytes.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to be serialized.
+
+        Returns:
+            bytes: CSV content encoded in UTF-8.
+
+        """
+
+        return dataframe.to_csv(sep=";", index=False).encode("UTF-8")
+
+    def should_overwrite(self, file_path: str, content_hash: str):
+        """
+        Decides whether an existing file should be overwritten according to the policy.
+
+        Args:
+            file_path (str): Path of the existing file.
+            content_hash (str): SHA-256 hash of the new content.
+
+        Returns:
+            bool: True if the file should be written.
+
+        """
+
+        if self.overwrite == "always":
+            self.logger.warning(
+                f"An existing file at the path '{file_path}' will be overwritten."
+            )
+            return True
+
+        if self.overwrite == "never":
+            self.logger.warning(
+                f"File '{file_path}' not saved because the file already exists."
+            )
+            return False
+
+        if self.overwrite == "if-changed":
+            if self.file_manager.file_hash(file_path) == content_hash:
+                self.logger.info(
+                    f"File '{file_path}' not saved because its content is unchanged."
+                )
+                return False
+            self.logger.warning(
+                f"An existing file at the path '{file_path}' has changed and will be overwritten."
+            )
+            return True
+
+        return self.ask_for_overwrite(file_path)
+
+    def ask_for_overwrite(self, file_path: str):
+        """
+        Asks the user whether to overwrite an existing file, assuming yes after 60 seconds.
+
+        Args:
+            file_path (str): Path of the existing file.
+
+        Returns:
+            bool: True if the file should be written.
+
+        """
+
         should_override = None
 
         def wait_for_input():
@@ -143,34 +432,193 @@ class CsvSaver:
                 f"File '{file_path}' already exists\nYou have 60 seconds to make a decision.\nDo you want to override it? (Y/N):\n"
             )
 
-        for file_path in file_paths:
-            if self.file_manager.file_exists(file_path):
-                # If the file already exists, prompt the user for a decision within 60 seconds
-                input_thread = threading.Thread(target=wait_for_input)
-                input_thread.daemon = True
-                input_thread.start()
-                input_thread.join(timeout=60)
-
-                if input_thread.is_alive():
-                    # If the user doesn't provide input within 60 seconds, assume "Y" (yes)
-                    should_override = "Y"
-                    input_thread.join(timeout=1)
-
-                if should_override.lower() != "y":
-                    # If the user chose not to override the existing file, log a warning and continue to the next file
-                    self.logger.warning(
-                        f"File '{file_path}' not saved because you chose not to overwrite the existing file."
-                    )
-                    continue
-                else:
-                    # If the user chose to override, delete the existing file
-                    self.file_manager.delete_file(file_path)
-                    self.logger.warning(
-                        f"An existing file at the path '{file_path}' has been deleted."
-                    )
-
-            # Save the DataFrame as a CSV file
-            dataframe.to_csv(file_path, sep=";", index=False, encoding="UTF-8")
-            self.logger.info(
-                f"Dataframe saved successfully to the path: '{file_path}'."
+        # If the file already exists, prompt the user for a decision within 60 seconds
+        input_thread = threading.Thread(target=wait_for_input)
+        input_thread.daemon = True
+        input_thread.start()
+        input_thread.join(timeout=60)
+
+        if input_thread.is_alive() or should_override is None:
+            # If the user doesn't provide input within 60 seconds, assume "Y" (yes)
+            should_override = "Y"
+            input_thread.join(timeout=1)
+
+        if should_override.lower() != "y":
+            # If the user chose not to override the existing file, log a warning and continue to the next file
+            self.logger.warning(
+                f"File '{file_path}' not saved because you chose not to overwrite the existing file."
+            )
+            return False
+
+        self.logger.warning(
+            f"An existing file at the path '{file_path}' will be overwritten."
+        )
+        return True
+
+
+class ParquetSaver:
+    """
+    Class for saving a DataFrame as a Parquet file partitioned by year and month.
+
+    Files are written to '<output_folder>/year=YYYY/month=MM/part-0.parquet', with the
+    rate stored as a float. Requires the optional pyarrow package.
+
+    Args:
+        output_folder (str): Root folder of the dataset. Defaults to the parquetFolder
+            environment variable or 'output/parquet'.
+        compression (str): Parquet compression codec. Defaults to 'snappy'.
+
+    Attributes:
+        output_folder (str): Root folder of the dataset.
+        logger (logging.Logger): Logger instance.
+
+    """
+
+    def __init__(self, output_folder=None, compression="snappy"):
+        ## pyarrow is optional, it is imported only when Parquet files are saved
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "The pyarrow package is required to save Parquet files (pip install pyarrow)"
             )
+        if output_folder is None:
+            output_folder = os.getenv("parquetFolder", os.path.join("output", "parquet"))
+        self.output_folder = output_folder
+        self.compression = compression
+        self.logger = logging.getLogger("__main__")
+
+    def get_file_path(self, month, year):
+        """
+        Returns the path of the partition file for the month and year.
+
+        Args:
+            month (str): Month.
+            year (str): Year.
+
+        Returns:
+            str: File path.
+
+        """
+        return os.path.join(
+            self.output_folder, f"year={year}", f"month={month}", "part-0.parquet"
+        )
+
+    def save_dataframe(self, dataframe: pd.DataFrame, month: str, year: str):
+        """
+        Saves a DataFrame as a Parquet partition, replacing an existing one.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to be saved.
+            month (str): Month of the partition.
+            year (str): Year of the partition.
+
+        """
+        if dataframe.empty:
+            self.logger.warning("Dataframe is empty. Parquet file not saved.")
+            return
+
+        file_path = self.get_file_path(month, year)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        tmp_path = f"{file_path}.tmp"
+        to_typed_frame(dataframe).to_parquet(
+            tmp_path, engine="pyarrow", compression=self.compression, index=False
+        )
+        os.replace(tmp_path, file_path)
+        self.logger.info(f"Dataframe saved successfully to the path: '{file_path}'.")
+
+
+class WarehouseSaver:
+    """
+    Class for upserting a DataFrame into a local SQLite table keyed by (year, month, unit_id).
+
+    The unit_id is the 4-character TERYT code built from the WOJ. and POW. columns.
+    Every month is written with one bulk insert inside one transaction, and the rate
+    is stored as REAL.
+
+    Args:
+        db_path (str): Path to the database file. Defaults to the warehouseDb
+            environment variable or 'output/warehouse.db'.
+
+    Attributes:
+        db_path (str): Path to the database file.
+        logger (logging.Logger): Logger instance.
+
+    """
+
+    TABLE = "unemployment_rate"
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.getenv("warehouseDb", os.path.join("output", "warehouse.db"))
+        self.db_path = db_path
+        self.logger = logging.getLogger("__main__")
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    year INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    unit_id TEXT NOT NULL,
+                    woj TEXT NOT NULL,
+                    pow TEXT NOT NULL,
+                    name TEXT,
+                    rate REAL,
+                    PRIMARY KEY (year, month, unit_id)
+                )
+                """
+            )
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_unit "
+                f"ON {self.TABLE} (unit_id, year, month)"
+            )
+
+    def save_dataframe(self, dataframe: pd.DataFrame, month: str, year: str):
+        """
+        Upserts the rows of a month into the warehouse table.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to be saved.
+            month (str): Month of the data.
+            year (str): Year of the data.
+
+        """
+        if dataframe.empty:
+            self.logger.warning("Dataframe is empty. Data not saved to the warehouse.")
+            return
+
+        typed = to_typed_frame(dataframe)
+        rows = [
+            (
+                int(year),
+                int(month),
+                woj + pow_,
+                woj,
+                pow_,
+                name,
+                None if pd.isna(rate) else float(rate),
+            )
+            for woj, pow_, name, rate in zip(
+                typed["woj"], typed["pow"], typed["name"], typed["stopa"]
+            )
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.TABLE} "
+                "(year, month, unit_id, woj, pow, name, rate) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self.logger.info(
+            f"{len(rows)} rows for {month}.{year} saved to the warehouse '{self.db_path}'."
+        )
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
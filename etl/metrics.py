@@ -0,0 +1,181 @@
+##########################################################
+## Pomiary czasu i liczniki etapów ETL (JSON/Prometheus) ##
+##########################################################
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and timers.
+
+    Timers keep the count, sum and maximum of the observed durations. The registry
+    can be written as JSON and in the Prometheus textfile format read by the
+    node exporter textfile collector.
+
+    Args:
+        prefix (str): Prefix of the Prometheus metric names. Defaults to 'unemployment_etl'.
+    """
+
+    def __init__(self, prefix="unemployment_etl"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Removes all recorded values.
+        """
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timers = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increases a counter.
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Sets a gauge to the value.
+        """
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Records a duration in seconds.
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            timer = self.timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """
+        Context manager recording the duration of the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Returns all values as a dictionary.
+
+        Returns:
+            dict: counters, gauges and timers, each a list of entries with name, labels and values.
+        """
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+                "timers": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": count,
+                        "sum_seconds": round(total, 6),
+                        "max_seconds": round(maximum, 6),
+                    }
+                    for (name, labels), (count, total, maximum) in sorted(
+                        self.timers.items()
+                    )
+                ],
+            }
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        values = ",".join(
+            '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for key, value in labels.items()
+        )
+        return "{" + values + "}"
+
+    def to_prometheus(self):
+        """
+        Returns the values in the Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for entry in snapshot["counters"]:
+            name = f"{self.prefix}_{entry['name']}"
+            declare(name, "counter")
+            lines.append(f"{name}{self._format_labels(entry['labels'])} {entry['value']}")
+        for entry in snapshot["gauges"]:
+            name = f"{self.prefix}_{entry['name']}"
+            declare(name, "gauge")
+            lines.append(f"{name}{self._format_labels(entry['labels'])} {entry['value']}")
+        for entry in snapshot["timers"]:
+            name = f"{self.prefix}_{entry['name']}_seconds"
+            labels = self._format_labels(entry["labels"])
+            declare(name, "summary")
+            lines.append(f"{name}_count{labels} {entry['count']}")
+            lines.append(f"{name}_sum{labels} {entry['sum_seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, folder, name=None):
+        """
+        Writes the metrics as '<name>.json' and '<name>.prom' into the folder.
+
+        Files are written to a temporary file and renamed, so the node exporter
+        never reads a partial file.
+
+        Args:
+            folder (str): Output folder.
+            name (str, optional): File name without extension. Defaults to the prefix.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        os.makedirs(folder, exist_ok=True)
+        name = name or self.prefix
+        outputs = {
+            os.path.join(folder, f"{name}.json"): json.dumps(self.snapshot(), indent=4),
+            os.path.join(folder, f"{name}.prom"): self.to_prometheus(),
+        }
+        for path, content in outputs.items():
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="UTF-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return list(outputs)
+
+
+## registry shared by the whole application
+metrics = Metrics()
@@ -0,0 +1,89 @@
+#####################################################################
+## Sprawdzanie, czy dane dla zmiennej i roku są już opublikowane ##
+#####################################################################
+
+import json
+import logging
+import os
+import threading
+import time
+
+
+class PublicationProbe:
+    """
+    Cheap check whether BDL already publishes data for a variable and year.
+
+    The check requests a single result (page-size=1) instead of crawling all pages.
+    Answers are cached in a JSON file: a published month stays published, while
+    a missing one is checked again after ttl seconds.
+
+    Args:
+        extractor (Extractor): Extractor used to build URLs and send requests.
+        cache_file (str): Path to the cache file. Defaults to 'cache/probe.json'.
+        ttl (int): Seconds after which an unpublished answer is checked again. Defaults to 6 hours.
+    """
+
+    def __init__(self, extractor, cache_file=os.path.join("cache", "probe.json"), ttl=6 * 3600):
+        self.extractor = extractor
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("__main__")
+        self.answers = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, encoding="UTF-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            json.dump(self.answers, f, indent=4)
+        os.replace(tmp_path, self.cache_file)
+
+    def is_published(self, variable_id: str, year: str) -> bool:
+        """
+        Checks whether the API has data for the variable and year.
+
+        Args:
+            variable_id (str): The variable ID.
+            year (str): The year.
+
+        Returns:
+            bool: True if the data is published.
+
+        Raises:
+            requests.exceptions.RequestException: If there is a problem with the internet connection.
+        """
+        key = f"{variable_id}|{year}"
+        with self.lock:
+            answer = self.answers.get(key)
+        if answer is not None and (
+            answer["published"] or time.time() - answer["checked"] < self.ttl
+        ):
+            return answer["published"]
+
+        url = self.extractor.build_url(variable_id, year, page_size=1)
+        response = self.extractor.get_response(url)
+        published = self.extractor.request_handler.read_page(response).valid
+        self.logger.info(
+            f"Variable {variable_id} for the year {year} is {'' if published else 'not '}published"
+        )
+        with self.lock:
+            self.answers[key] = {"published": published, "checked": time.time()}
+            self._save()
+        return published
+
+    def forget(self, variable_id: str, year: str) -> None:
+        """
+        Removes the cached answer for the variable and year.
+        """
+        with self.lock:
+            if self.answers.pop(f"{variable_id}|{year}", None) is not None:
+                self._save()
@@ -0,0 +1,225 @@
+###############################################################
+## Klasy ograniczające liczbę zapytań do API BDL (rate limit) ##
+###############################################################
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from etl.metrics import metrics
+
+## (period in seconds, number of requests) - limits published for the BDL API
+BDL_LIMITS = {
+    "anonymous": [(1, 5), (15 * 60, 100), (12 * 3600, 1000), (7 * 24 * 3600, 10000)],
+    "registered": [(1, 10), (15 * 60, 500), (12 * 3600, 5000), (7 * 24 * 3600, 50000)],
+}
+
+
+def parse_client_ids(value):
+    """
+    Splits a comma separated list of X-ClientId keys.
+
+    Args:
+        value (str): Value of the X-ClientId variable, may be None.
+
+    Returns:
+        list: List of client ids, [None] for anonymous access.
+    """
+    client_ids = [token.strip() for token in (value or "").split(",") if token.strip()]
+    return client_ids or [None]
+
+
+def parse_retry_after(value, now=None):
+    """
+    Converts a Retry-After (or rate limit reset) header value to seconds.
+
+    Args:
+        value (str): Number of seconds or an HTTP / ISO date.
+        now (datetime, optional): Current time. Defaults to the current UTC time.
+
+    Returns:
+        float: Number of seconds to wait, or None if the value can't be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    now = now or datetime.now(timezone.utc)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            date = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket allowing capacity requests per period.
+
+    Args:
+        capacity (int): Maximum number of requests in the period.
+        period (float): Length of the period in seconds.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.rate = self.capacity / self.period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Returns the number of seconds until a token is available.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def set_remaining(self, remaining, now):
+        """
+        Aligns the bucket with the number of requests reported as remaining by the server.
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class ClientLimiter:
+    """
+    Set of token buckets for a single X-ClientId.
+
+    Args:
+        client_id (str): The client id, None for anonymous access.
+        limits (list): List of (period, capacity) tuples.
+    """
+
+    def __init__(self, client_id, limits):
+        self.client_id = client_id
+        self.buckets = {period: TokenBucket(capacity, period) for period, capacity in limits}
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        waits = [bucket.wait_time(now) for bucket in self.buckets.values()]
+        waits.append(self.blocked_until - now)
+        return max(0.0, max(waits))
+
+    def consume(self, now):
+        for bucket in self.buckets.values():
+            bucket.consume(now)
+
+    def block_for(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class RateLimiter:
+    """
+    Thread-safe rate limiter shared by all requests sent to the BDL API.
+
+    Every X-ClientId gets its own set of token buckets sized from BDL_LIMITS.
+    acquire() blocks until one of the keys is allowed to send a request and
+    returns the key with the shortest wait, which spreads the traffic over the pool.
+    observe() reads Retry-After and X-Rate-Limit-* headers of the response.
+
+    Args:
+        client_ids (list, optional): List of client ids. Defaults to [None] (anonymous access).
+        limits (dict, optional): Limits per access type. Defaults to BDL_LIMITS.
+    """
+
+    def __init__(self, client_ids=None, limits=None):
+        limits = limits or BDL_LIMITS
+        client_ids = client_ids or [None]
+        self.clients = {
+            client_id: ClientLimiter(
+                client_id,
+                limits["registered"] if client_id else limits["anonymous"],
+            )
+            for client_id in client_ids
+        }
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("__main__")
+
+    def acquire(self):
+        """
+        Waits until a request may be sent and reserves it.
+
+        Returns:
+            str: The client id to use for the request (None for anonymous access).
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                client = min(self.clients.values(), key=lambda c: c.wait_time(now))
+                wait = client.wait_time(now)
+                if wait <= 0:
+                    client.consume(now)
+                    return client.client_id
+            metrics.inc("ratelimit_sleep_seconds_total", wait)
+            time.sleep(wait)
+
+    def observe(self, client_id, response):
+        """
+        Updates the limiter from the response headers.
+
+        Args:
+            client_id (str): Client id used for the request.
+            response (requests.Response): The response object.
+
+        Returns:
+            bool: True if the request was rejected with 429 and should be repeated.
+        """
+        client = self.clients.get(client_id)
+        if client is None:
+            return False
+        headers = response.headers
+        now = time.monotonic()
+        with self.lock:
+            remaining = headers.get("X-Rate-Limit-Remaining")
+            if remaining is not None and remaining.isdigit():
+                limit = headers.get("X-Rate-Limit-Limit")
+                bucket = self._match_bucket(client, limit)
+                if bucket is not None:
+                    bucket.set_remaining(int(remaining), now)
+                if int(remaining) == 0:
+                    reset = parse_retry_after(headers.get("X-Rate-Limit-Reset"))
+                    if reset:
+                        client.block_for(reset, now)
+
+            if response.status_code == 429:
+                retry_after = parse_retry_after(headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = 1.0
+                client.block_for(retry_after, now)
+                self.logger.warning(
+                    f"Rate limit exceeded for the client id, waiting {retry_after:.0f} sec"
+                )
+                return True
+        return False
+
+    def _match_bucket(self, client, limit):
+        """
+        Returns the bucket whose capacity matches the X-Rate-Limit-Limit header.
+        """
+        if limit is None or not str(limit).isdigit():
+            return None
+        for bucket in client.buckets.values():
+            if int(bucket.capacity) == int(limit):
+                return bucket
+        return None
@@ -0,0 +1,141 @@
+##############################################################
+## Polityka ponawiania zapytań i wyłącznik (circuit breaker) ##
+##############################################################
+
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from etl.metrics import metrics
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without sending a request while the circuit breaker is open.
+    """
+
+
+class RetryPolicy:
+    """
+    Timeouts and retry rules of the API requests.
+
+    Connection errors, timeouts and the statuses in RETRY_STATUSES are retried with
+    exponential backoff and full jitter. Other 4xx statuses are returned at once.
+    A Retry-After header sent with a retried status is respected.
+
+    Args:
+        connect_timeout (float): Seconds to wait for the connection. Defaults to 5.
+        read_timeout (float): Seconds to wait for the response. Defaults to 30.
+        max_attempts (int): Attempts of one request, the first one included. Defaults to 6.
+        backoff (float): Base of the backoff in seconds. Defaults to 0.5.
+        max_backoff (float): Maximum single wait in seconds. Defaults to 30.
+        deadline (float): Seconds after which a request isn't retried anymore. Defaults to 180.
+    """
+
+    RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+    def __init__(
+        self,
+        connect_timeout=5.0,
+        read_timeout=30.0,
+        max_attempts=6,
+        backoff=0.5,
+        max_backoff=30.0,
+        deadline=180.0,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.random = random.Random()
+
+    def is_retryable(self, status_code):
+        """
+        Returns True if a response with the status should be repeated.
+        """
+        return status_code in self.RETRY_STATUSES
+
+    def wait_time(self, attempt, retry_after=None):
+        """
+        Returns the wait before the next attempt.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting at 1.
+            retry_after (float, optional): Wait requested by the server in seconds.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return self.random.uniform(0, cap)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after repeated failures.
+
+    After failure_threshold failed attempts in a row the breaker opens and every
+    request fails at once with CircuitOpenError. After reset_timeout seconds one
+    trial request is let through: a success closes the breaker, a failure opens it again.
+
+    Args:
+        failure_threshold (int): Failed attempts in a row that open the breaker. Defaults to 10.
+        reset_timeout (float): Seconds after which a trial request is sent. Defaults to 60.
+    """
+
+    def __init__(self, failure_threshold=10, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("__main__")
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_request(self):
+        """
+        Checks whether a request may be sent.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    "The BDL API is unavailable, requests are stopped for "
+                    f"{self.reset_timeout:.0f} sec after {self.failures} failures"
+                )
+            self.trial = True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                self.logger.info("The BDL API is available again")
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self.trial = False
+                metrics.inc("circuit_open_total")
+                self.logger.error(
+                    f"The circuit breaker is open after {self.failures} failed requests"
+                )
@@ -1,6 +1,10 @@
+import numpy as np
 import pandas as pd
-from typing import Dict
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from etl.decode import ID_LENGTH, UnitColumns
+from etl.metrics import metrics
 
 
 class Transform:
@@ -9,46 +13,64 @@ class Transform:
 
     Methods:
         transform_data_from_API(): Transforms data received from an API.
+        frame_from_columns(): Builds the filtered DataFrame from columnar data.
+        classify_ID(): Classifies unit IDs by the unit level.
+        classify_fixed_ID(): Classifies 12-character unit IDs by the unit level.
         filter_ID(): Filters DataFrame rows based on ID patterns.
         map_columns(): Reindexes columns and sorts values.
         transform_column(): Transforms values in a specific column.
 
     """
 
+    ID_PATTERNS = {
+        "Makro": r"^0([1-7])0{10}$",
+        "Region": r"^0([1-7]\d{2}[1-2])0{7}$",
+        "Podregion": r"0[1-7]\d{3}([0-9][1-9]|[1-9][0-9])0{5}$",
+        "Nieokreślona": r"([0-9]{9}998)$",
+        "Tekst": r".*REGION.*",
+    }
+
     def __init__(self):
         """
         Initializes the Transform instance.
         """
         pass
 
-    def transform_data_from_API(self, data):
+    def transform_data_from_API(self, data, record_metrics=True):
         """
         Transforms data received from an API.
 
         Args:
-            data: Data received from the API.
+            data: Data received from the API: UnitColumns, an iterator of UnitColumns
+                (one per page) or a list / an iterator of row dictionaries.
+            record_metrics (bool, optional): Record the transform counters and timer.
+                Defaults to True, False in the worker processes of TransformPool.
 
         Returns:
             pd.DataFrame: Transformed DataFrame.
 
         """
-        id_reg_pattern = {
-            "Makro": r"^0([1-7])0{10}$",
-            "Region": r"^0([1-7]\d{2}[1-2])0{7}$",
-            "Podregion": r"0[1-7]\d{3}([0-9][1-9]|[1-9][0-9])0{5}$",
-            "Nieokreślona": r"([0-9]{9}998)$",
-            "Tekst": r".*REGION.*",
-        }
+        if not isinstance(data, UnitColumns):
+            data = list(data)
+            if data and isinstance(data[0], UnitColumns):
+                data = UnitColumns.concat(data)
+        ## the timer starts after the streamed pages are downloaded, so it doesn't count HTTP
+        starttime = time.perf_counter()
 
-        df = pd.DataFrame(data)
-        df = df[df["id"].notnull()]
+        if isinstance(data, UnitColumns):
+            rows_in = len(data)
+            df = self.frame_from_columns(data)
+        else:
+            df = pd.DataFrame(data)
+            rows_in = len(df)
+            df = df[df["id"].notnull()]
 
-        df = self.filter_ID(df, id_reg_pattern)
+            df = self.filter_ID(df)
 
-        ## CREATE NEW COLUMNS
-        df["WOJ."] = df["id"].str[2:4]
-        df["POW."] = df["id"].str[7:9]
-        df[""] = ""
+            ## CREATE NEW COLUMNS
+            df["WOJ."] = df["id"].str[2:4]
+            df["POW."] = df["id"].str[7:9]
+            df[""] = ""
 
         ## Reindex columns and sort values by woj and pow
         new_columns = ["WOJ.", "POW.", "", "name", "stopa"]
@@ -59,33 +81,134 @@ class Transform:
         df = self.transform_column(df, "stopa", ".", ",", False)
 
         ### Adds the prefix "WOJ." to name for all WOJ IDs.
-        for index, row in df.iterrows():
-            if row["WOJ."] != "00" and row["POW."] == "00":
-                df.at[index, "name"] = "WOJ. " + row["name"]
+        woj_mask = (df["WOJ."] != "00") & (df["POW."] == "00")
+        df.loc[woj_mask, "name"] = "WOJ. " + df.loc[woj_mask, "name"]
+        if record_metrics:
+            metrics.inc("transform_rows_in_total", rows_in)
+            metrics.inc("transform_rows_out_total", len(df))
+            metrics.observe("transform", time.perf_counter() - starttime)
         return df
 
-    def filter_ID(self, df: pd.DataFrame, reg_pattern: Dict):
+    def frame_from_columns(self, columns: UnitColumns):
+        """
+        Builds the DataFrame of the kept units from columnar data.
+
+        The IDs are filtered and the WOJ. / POW. codes are cut from the fixed-width
+        ID array, without building an object per row first.
+
+        Args:
+            columns (UnitColumns): Columns received from the API.
+
+        Returns:
+            pd.DataFrame: DataFrame with WOJ., POW., empty, name and stopa columns.
+
+        """
+        keep = self.classify_fixed_ID(columns.id) == "Jednostka"
+        chars = columns.id[keep].view("U1").reshape(-1, ID_LENGTH)
+        return pd.DataFrame(
+            {
+                "WOJ.": np.ascontiguousarray(chars[:, 2:4]).view("U2").ravel(),
+                "POW.": np.ascontiguousarray(chars[:, 7:9]).view("U2").ravel(),
+                "": "",
+                "name": columns.name[keep],
+                "stopa": columns.stopa[keep],
+            }
+        )
+
+    def classify_ID(self, ids: pd.Series):
+        """
+        Classifies unit IDs by the unit level.
+
+        12-character IDs are classified from fixed character positions on a numpy
+        array of character codes. Other IDs fall back to the regex patterns.
+
+        Args:
+            ids (pd.Series): Series of unit IDs.
+
+        Returns:
+            np.ndarray: Level of every ID, one of ID_PATTERNS keys or "Jednostka" for kept units.
+
+        """
+        ids = ids.astype(str)
+        levels = np.full(len(ids), "Jednostka", dtype=object)
+        is_fixed = (ids.str.len() == 12).to_numpy()
+
+        if is_fixed.any():
+            levels[is_fixed] = self.classify_fixed_ID(
+                ids[is_fixed].to_numpy().astype("U12")
+            )
+
+        if not is_fixed.all():
+            other = ids[~is_fixed]
+            other_levels = np.full(len(other), "Jednostka", dtype=object)
+            for level, pat in self.ID_PATTERNS.items():
+                if level == "Tekst":
+                    match = other.str.contains(pat, flags=re.IGNORECASE, regex=True)
+                else:
+                    match = other.str.extract(pat, expand=False).notna()
+                other_levels[match.to_numpy() & (other_levels == "Jednostka")] = level
+            levels[~is_fixed] = other_levels
+
+        return levels
+
+    def classify_fixed_ID(self, ids: np.ndarray):
+        """
+        Classifies 12-character unit IDs from fixed character positions.
+
+        Args:
+            ids (np.ndarray): Unit IDs, dtype U12.
+
+        Returns:
+            np.ndarray: Level of every ID, one of ID_PATTERNS keys or "Jednostka" for kept units.
+
+        """
+        codes = ids.view(np.uint32).reshape(-1, ID_LENGTH)
+        digit = (codes >= ord("0")) & (codes <= ord("9"))
+        zero = codes == ord("0")
+        prefix = zero[:, 0] & (codes[:, 1] >= ord("1")) & (codes[:, 1] <= ord("7"))
+
+        levels = np.full(len(codes), "Jednostka", dtype=object)
+        levels[
+            digit[:, :9].all(axis=1)
+            & (codes[:, 9] == ord("9"))
+            & (codes[:, 10] == ord("9"))
+            & (codes[:, 11] == ord("8"))
+        ] = "Nieokreślona"
+        levels[
+            prefix
+            & digit[:, 2:7].all(axis=1)
+            & ~zero[:, 5:7].all(axis=1)
+            & zero[:, 7:].all(axis=1)
+        ] = "Podregion"
+        levels[
+            prefix
+            & digit[:, 2:4].all(axis=1)
+            & ((codes[:, 4] == ord("1")) | (codes[:, 4] == ord("2")))
+            & zero[:, 5:].all(axis=1)
+        ] = "Region"
+        levels[prefix & zero[:, 2:].all(axis=1)] = "Makro"
+
+        ## text IDs can't match the digit patterns above
+        is_text = np.flatnonzero(~digit.all(axis=1))
+        if len(is_text):
+            pattern = re.compile(self.ID_PATTERNS["Tekst"], flags=re.IGNORECASE)
+            text = np.array([bool(pattern.search(unit_id)) for unit_id in ids[is_text]], dtype=bool)
+            levels[is_text[text]] = "Tekst"
+        return levels
+
+    def filter_ID(self, df: pd.DataFrame):
         """
         Filters DataFrame rows based on ID patterns.
 
         Args:
             df (pd.DataFrame): Input DataFrame.
-            reg_pattern (Dict): Dictionary of ID patterns.
 
         Returns:
-            pd.DataFrame: Filtered DataFrame.
-
-        """
-        for pat in reg_pattern.values():
-            if pat == ".*REGION.*":
-                df = df[
-                    ~df["id"]
-                    .astype(str)
-                    .str.contains(pat, flags=re.IGNORECASE, regex=True)
-                ]
-            else:
-                df = df[df["id"].astype("string").str.extract(pat, expand=False).isna()]
-        return df
+            pd.DataFrame: DataFrame without the macroregion, region, subregion,
+                unspecified and text IDs.
+
+        """
+        return df[self.classify_ID(df["id"]) == "Jednostka"]
 
     def map_columns(self, df, new_columns):
         """
@@ -128,3 +251,87 @@ class Transform:
             .str.strip()
         )
         return df
+
+
+def transform_in_worker(data):
+    """
+    Runs Transform.transform_data_from_API in a worker process of TransformPool.
+
+    Returns:
+        tuple: Transformed DataFrame and the transform time in seconds.
+    """
+    starttime = time.perf_counter()
+    ## the metrics lock may have been copied locked by the fork, the parent records the metrics
+    df = Transform().transform_data_from_API(data, record_metrics=False)
+    return df, time.perf_counter() - starttime
+
+
+def worker_ready():
+    """
+    Empty task that starts a worker process of TransformPool.
+    """
+    return True
+
+
+class TransformPool:
+    """
+    Process pool running the Transform step next to the extract threads.
+
+    The Transform step is CPU bound and holds the GIL, so on a large backfill it
+    competes with the download threads. The pool sends the columns of a month to a
+    worker process and gets the transformed DataFrame back. The id and stopa columns
+    are pickled as flat numpy buffers and every unit name once per month. Results are
+    returned in the order of the input, so the saved files don't depend on which worker
+    finishes first.
+
+    The worker processes are started when the pool is created, so it should be
+    created before any other thread is started.
+
+    Args:
+        workers (int): Number of worker processes.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, int(workers))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        ## the workers are forked now, before the download threads exist and can hold a lock
+        for future in [self.executor.submit(worker_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def transform_many(self, data_list):
+        """
+        Transforms several months on the worker processes.
+
+        Args:
+            data_list (list): Data of every month, as accepted by transform_data_from_API.
+
+        Returns:
+            list: Transformed DataFrames in the order of data_list.
+        """
+        data_list = [self._collect(data) for data in data_list]
+        frames = []
+        for data, (df, seconds) in zip(
+            data_list, self.executor.map(transform_in_worker, data_list)
+        ):
+            ## the counters of the workers are lost with their process, so they are recorded here
+            metrics.inc("transform_rows_in_total", len(data))
+            metrics.inc("transform_rows_out_total", len(df))
+            metrics.observe("transform", seconds)
+            frames.append(df)
+        return frames
+
+    @staticmethod
+    def _collect(data):
+        ## pages streamed from the API are joined before they are sent to a worker
+        if isinstance(data, UnitColumns):
+            return data
+        data = list(data)
+        if data and isinstance(data[0], UnitColumns):
+            return UnitColumns.concat(data)
+        return data
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        self.executor.shutdown()
@@ -0,0 +1,138 @@
+###################################################################
+## Współdzielona pula połączeń HTTP z kompresją dla klienta BDL ##
+###################################################################
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from etl.metrics import metrics
+
+USER_AGENT = f"UnEmploymentApi python-requests/{requests.__version__}"
+
+
+class Transport:
+    """
+    Pooled keep-alive HTTP transport of the BDL client.
+
+    All threads share one HTTPAdapter, so the TCP/TLS connections are reused across
+    pages, variables and years. Every thread gets its own Session mounted on that
+    adapter (a Session keeps cookies and is not meant to be shared between threads).
+    The pool holds pool_size connections per host and blocks when all of them are in
+    use, instead of opening connections that are thrown away afterwards. Responses
+    are requested compressed with gzip or deflate.
+
+    Args:
+        pool_size (int): Connections kept per host, usually the number of concurrent
+            requests. Defaults to 10.
+        user_agent (str): The User-Agent header. Defaults to USER_AGENT.
+    """
+
+    HEADERS = {
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    }
+
+    def __init__(self, pool_size=10, user_agent=USER_AGENT):
+        self.pool_size = max(1, int(pool_size))
+        ## retries are done by RequestHandler, the adapter sends every request once
+        self.adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=self.pool_size, max_retries=0, pool_block=True
+        )
+        self.headers = dict(self.HEADERS, **{"User-Agent": user_agent})
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+
+    @property
+    def session(self):
+        """
+        Session of the calling thread.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self.local.session = session
+        return session
+
+    def get(self, url, headers=None, timeout=None):
+        """
+        Sends a GET request on a pooled connection.
+
+        Args:
+            url (str): The request URL.
+            headers (dict, optional): Request headers added to the default ones.
+            timeout (tuple, optional): Connect and read timeout in seconds.
+
+        Returns:
+            requests.Response: The response object with the decompressed body.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+        """
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        body_bytes = len(response.content)
+        ## tell() counts the bytes read from the socket, before decompression
+        try:
+            wire_bytes = response.raw.tell() or body_bytes
+        except (AttributeError, OSError):
+            wire_bytes = body_bytes
+        with self.lock:
+            self.requests += 1
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+        metrics.inc("http_wire_bytes_total", wire_bytes)
+        return response
+
+    def connection_counts(self):
+        """
+        Returns the number of connections opened and requests sent by the pools.
+        """
+        connections = 0
+        requests_sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return connections, requests_sent
+
+    def stats(self):
+        """
+        Returns the traffic and connection reuse statistics of the transport.
+
+        Returns:
+            dict: Requests, bytes on the wire and after decompression, the saved share
+                of the traffic, connections opened and the share of requests sent on
+                a reused connection.
+        """
+        connections, requests_sent = self.connection_counts()
+        with self.lock:
+            stats = {
+                "requests": self.requests,
+                "wire_bytes": self.wire_bytes,
+                "body_bytes": self.body_bytes,
+                "connections_opened": connections,
+                "pool_size": self.pool_size,
+            }
+        stats["compression_saving"] = (
+            round(1 - stats["wire_bytes"] / stats["body_bytes"], 3) if stats["body_bytes"] else 0.0
+        )
+        stats["connection_reuse"] = (
+            round(1 - connections / requests_sent, 3) if requests_sent else 0.0
+        )
+        return stats
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.adapter.close()
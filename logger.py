@@ -1,9 +1,16 @@
+import atexit
+import json
 import logging
+import queue
 from logging import handlers
 import time
 import os
 
 
+## queues and handlers of the started listeners, used by flush_logs
+LISTENERS = []
+
+
 class MyFormatter(logging.Formatter):
     """
     Custom log formatter class.
@@ -25,6 +32,10 @@ class MyFormatter(logging.Formatter):
 
     def __init__(self, fmt="%(levelno)s: %(msg)s"):
         super().__init__(fmt)
+        # One formatter per level, built once instead of for every record
+        self.formatters = {
+            level: logging.Formatter(level_fmt) for level, level_fmt in self.formats.items()
+        }
 
     def format(self, record):
         """
@@ -38,19 +49,126 @@ class MyFormatter(logging.Formatter):
 
         """
 
-        # Get the format based on the logging level
-        log_fmt = self.formats.get(record.levelno, self._fmt)
+        # Get the formatter based on the logging level
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
+
+        return formatter.format(record)
+
+
+class LazyJson:
+    """
+    Serializes an object to JSON only when the log message is formatted.
+
+    Usage:
+        logger.info("Data: %s", LazyJson(data, indent=4))
+    """
+
+    def __init__(self, obj, **kwargs):
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return json.dumps(self.obj, **self.kwargs)
+
+
+class ThreadQueueHandler(handlers.QueueHandler):
+    """
+    Queue handler for a listener running in the same process.
+
+    The record is put on the queue as it is, so formatting the message and the
+    traceback is done by the listener thread and not by the logging thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class DigestSMTPHandler(handlers.BufferingHandler):
+    """
+    Collects records and sends them as one email when flushed.
+
+    The handler is flushed at the end of the run (or when the capacity is reached),
+    so an error costs one SMTP connection per run instead of one per record.
+
+    Args:
+        smtp_handler (logging.handlers.SMTPHandler): Handler used to send the digest.
+        capacity (int): Number of records that triggers sending. Defaults to 1000.
+    """
+
+    def __init__(self, smtp_handler, capacity=1000):
+        super().__init__(capacity)
+        self.smtp_handler = smtp_handler
+        self.smtp_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def flush(self):
+        """
+        Sends the buffered records in one email and clears the buffer.
+        """
+        self.acquire()
+        try:
+            if not self.buffer:
+                return
+            body = "\n\n".join(self.format(record) for record in self.buffer)
+            digest = logging.makeLogRecord(
+                {
+                    "name": self.buffer[-1].name,
+                    "levelno": max(record.levelno for record in self.buffer),
+                    "msg": f"{len(self.buffer)} error(s) logged:\n\n{body}",
+                }
+            )
+            self.smtp_handler.emit(digest)
+            self.buffer = []
+        finally:
+            self.release()
+
+
+def create_digest_handler(starttime, fmt):
+    """
+    Creates the error digest handler from the email settings in .env.
+
+    Args:
+        starttime (str): Start time of the run, used in the email subject.
+        fmt (logging.Formatter): Formatter of the records in the email.
+
+    Returns:
+        DigestSMTPHandler: The handler, or None if the email settings are incomplete.
+
+    """
+    email_subject = f"Errors occurred in UnEmploymentApi Download. Look at log {starttime}.log"  ## temporary
+    host = os.getenv("mailhost")
+    port = os.getenv("port")
+    emailFrom = os.getenv("EmailAcc")
+    emailTo = os.getenv("EmailTo")
+    password = os.getenv("EmailPass")
 
-        # Call the original formatter class to do the grunt work
-        result = logging.Formatter(log_fmt).format(record)
+    if any(var == "" or var is None for var in [host, port, emailFrom, emailTo, password]):
+        return None
 
-        return result
+    ## SMTPHandler connects only when a digest is sent
+    smtp_handler = handlers.SMTPHandler(
+        mailhost=(host, port),
+        fromaddr=emailFrom,
+        toaddrs=emailTo.split(","),
+        subject=email_subject,
+        credentials=(emailFrom, password),
+        secure=(),
+    )
+    digest_handler = DigestSMTPHandler(smtp_handler)
+    digest_handler.setLevel(logging.ERROR)
+    digest_handler.setFormatter(fmt)
+    return digest_handler
 
 
 def initialize_logger(name):
     """
     Initializes and configures a logger with file and console handlers.
 
+    The logger only puts records on a queue. A QueueListener thread writes them to
+    the file and the console and collects errors for the email digest, which is
+    sent when the listener is stopped at exit.
+
     Args:
         name (str): The name of the logger.
 
@@ -74,42 +192,64 @@ def initialize_logger(name):
     ch.setLevel(logging.INFO)
     ch.setFormatter(fmt)
 
-    ## Smtplogger
-    email_subject = f"Error occurred in UnEmploymentApi Download. Look at log {starttime}.log"  ## temporary
-    host = os.getenv("mailhost")
-    port = os.getenv("port")
-    emailFrom = os.getenv("EmailAcc")
-    emailTo: list = os.getenv("EmailTo").split(",")
-    credentials: tuple = (os.getenv("EmailAcc"), os.getenv("EmailPass"))
-
-    if any(
-        var == "" or var is None
-        for var in [email_subject, host, port, emailFrom, emailTo, credentials]
-    ):
-        raise ValueError("One or more variables in .env are None")
+    handlers_list = [hdlr, ch]
+    digest_handler = create_digest_handler(starttime, fmt)
+    if digest_handler is not None:
+        handlers_list.append(digest_handler)
 
-    smtp_handler = handlers.SMTPHandler(
-        mailhost=(host, port),
-        fromaddr=emailFrom,
-        toaddrs=emailTo,
-        subject=email_subject,
-        credentials=credentials,
-        secure=(),
+    # The handlers run on the listener thread, the logger only enqueues records
+    log_queue = queue.Queue(-1)
+    listener = handlers.QueueListener(
+        log_queue, *handlers_list, respect_handler_level=True
     )
-    smtp_handler.setLevel(logging.ERROR)
-    smtp_handler.setFormatter(fmt)
+    listener.start()
+    logger.addHandler(ThreadQueueHandler(log_queue))
+
+    def stop_listener():
+        # Write the queued records first, then send the error digest
+        listener.stop()
+        for handler in handlers_list:
+            handler.close()
 
-    # Add the handlers to the logger
-    logger.addHandler(smtp_handler)
-    logger.addHandler(hdlr)
-    logger.addHandler(ch)
+    atexit.register(stop_listener)
+    LISTENERS.append((log_queue, handlers_list))
 
     logger.setLevel(logging.DEBUG)
+    if digest_handler is None:
+        logger.warning(
+            "Email settings in .env are incomplete, errors won't be sent by email"
+        )
     # logger.propagate = True  ## wyłącza logowanie w konsoli
 
     return logger
 
 
+def flush_logs():
+    """
+    Waits until the queued records are written and sends the error digest.
+
+    A single run sends the digest at exit. The daemon mode calls it after every run,
+    so errors are emailed without stopping the process.
+    """
+    for log_queue, handlers_list in LISTENERS:
+        ## the listener marks every handled record as done
+        log_queue.join()
+        for handler in handlers_list:
+            handler.flush()
+
+
+def active_log_files():
+    """
+    Returns the absolute paths of the log files written by the started listeners.
+    """
+    return {
+        os.path.abspath(handler.baseFilename)
+        for _, handlers_list in LISTENERS
+        for handler in handlers_list
+        if isinstance(handler, logging.FileHandler)
+    }
+
+
 def get_logger(name):
     """
     Retrieves the initialized logger.
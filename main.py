@@ -1,9 +1,9 @@
 ############## IMPORT PACKAGES ##################
+## pandas, requests and the ETL modules are imported only by the commands that need them,
+## so --add_year, --clear_cache and -h start without loading them
 import argparse
-from logger import get_logger
-from utilities import ConfigManager, delete_logs
 from dotenv import load_dotenv
-from downloader import UnemploymentDownloader
+import os
 import sys
 
 
@@ -23,12 +23,33 @@ def validate_month(month):
     return month
 
 
+def validate_year_month(value):
+    if len(value) != 7 or value[4] != "-" or not (value[:4] + value[5:]).isdigit():
+        raise argparse.ArgumentTypeError("The month must have the format YYYY-MM.")
+    validate_year(value[:4])
+    if not 1 <= int(value[5:]) <= 12:
+        raise argparse.ArgumentTypeError("The month must be in the range 01-12.")
+    return value
+
+
+def validate_interval(value):
+    if not value.isdigit() or int(value) <= 0:
+        raise argparse.ArgumentTypeError("The interval must be a positive number of seconds")
+    return int(value)
+
+
 def validate_add_year(value):
     if int(value) <= 0:
         raise argparse.ArgumentTypeError("The given value must be a positive value")
     return int(value)
 
 
+def validate_jobs(value):
+    if not value.isdigit() or int(value) <= 0:
+        raise argparse.ArgumentTypeError("The number of jobs must be a positive integer")
+    return int(value)
+
+
 def main():
     ### load data for .env
     load_dotenv()
@@ -72,6 +93,30 @@ def main():
         ],
     )
 
+    ### create parser group for the date range downloader
+    range_group = parser.add_argument_group("Get data for a range of months")
+    range_group.add_argument(
+        "--from",
+        dest="date_from",
+        type=validate_year_month,
+        help="First month of the range, YYYY-MM. The months are downloaded from the newest one, "
+        "months marked as downloaded in config.json are skipped",
+        metavar="YYYY-MM",
+    )
+    range_group.add_argument(
+        "--to",
+        dest="date_to",
+        type=validate_year_month,
+        help="Last month of the range, YYYY-MM (default: the current month)",
+        metavar="YYYY-MM",
+    )
+    range_group.add_argument(
+        "--plan",
+        help="Print the months to download and the estimated number of API requests, "
+        "without downloading",
+        action="store_true",
+    )
+
     ### create parser group for the add new year and months to the config file
     add_year_group = parser.add_argument_group("Add Year")
     add_year_group.add_argument(
@@ -82,6 +127,122 @@ def main():
         metavar="NUMBER_OF_YEARS",
     )
 
+    ### create parser group for the service mode
+    daemon_group = parser.add_argument_group("Service mode")
+    daemon_group.add_argument(
+        "--daemon",
+        help="Keep running and check for new data every --interval seconds with a one-row "
+        "request, the ETL runs only when a new month is published. Use with --config or --from. "
+        "SIGTERM stops the service after the months in progress are saved",
+        action="store_true",
+    )
+    daemon_group.add_argument(
+        "--interval",
+        help="Seconds between the checks for new data in the service mode. "
+        "Defaults to the pollInterval variable or 3600",
+        type=validate_interval,
+        default=os.getenv("pollInterval", "3600"),
+        metavar="SECONDS",
+    )
+    daemon_group.add_argument(
+        "--heartbeat",
+        help="Heartbeat file with the state of the service, rewritten after every step. "
+        "Defaults to the heartbeatFile variable or heartbeat.json",
+        default=os.getenv("heartbeatFile", "heartbeat.json"),
+        metavar="FILE",
+    )
+
+    ### create parser group for the execution options
+    run_group = parser.add_argument_group("Execution options")
+    run_group.add_argument(
+        "--jobs",
+        help="Number of months downloaded and transformed in parallel (default: 1)",
+        type=validate_jobs,
+        default=1,
+        metavar="N",
+    )
+    run_group.add_argument(
+        "--backend",
+        help="Page fetching backend: 'sync' follows the next links one by one, 'async' fetches the remaining pages concurrently (default: sync)",
+        choices=["sync", "async"],
+        default="sync",
+    )
+    run_group.add_argument(
+        "--transform_workers",
+        help="Run the Transform step on N worker processes, next to the download threads "
+        "(useful with --jobs or --batch on large backfills). Without N the number of CPUs is used",
+        type=validate_jobs,
+        nargs="?",
+        const=os.cpu_count() or 1,
+        default=0,
+        metavar="N",
+    )
+    run_group.add_argument(
+        "--batch",
+        help="Download each month for all requested years in one crawl",
+        action="store_true",
+    )
+    run_group.add_argument(
+        "--parquet",
+        help="Also save the data as Parquet partitioned by year and month (requires pyarrow). "
+        "The folder defaults to the parquetFolder variable or output/parquet",
+        nargs="?",
+        const=os.getenv("parquetFolder", os.path.join("output", "parquet")),
+        metavar="FOLDER",
+    )
+    run_group.add_argument(
+        "--warehouse",
+        help="Also upsert the data into a local SQLite database keyed by year, month and unit. "
+        "The path defaults to the warehouseDb variable or output/warehouse.db",
+        nargs="?",
+        const=os.getenv("warehouseDb", os.path.join("output", "warehouse.db")),
+        metavar="DB_FILE",
+    )
+    run_group.add_argument(
+        "--overwrite",
+        help="What to do with existing CSV files: 'ask' prompts for 60 seconds, 'always', "
+        "'never', 'if-changed' writes only files with a different content (default: ask)",
+        choices=["ask", "always", "never", "if-changed"],
+        default="ask",
+    )
+    run_group.add_argument(
+        "--probe",
+        help="Before crawling a month, check with a one-row request whether it is published. "
+        "Unpublished months are checked again after 6 hours",
+        action="store_true",
+    )
+    run_group.add_argument(
+        "--state",
+        help="Where the download state is kept: 'json' rewrites config.json after every month, "
+        "'sqlite' uses state.db and exports config.json at the end of the run (default: json)",
+        choices=["json", "sqlite"],
+        default="json",
+    )
+    run_group.add_argument(
+        "--metrics",
+        help="Write stage timings and counters as JSON and as a Prometheus textfile at the end "
+        "of the run. The folder defaults to the metricsFolder variable or metrics",
+        nargs="?",
+        const=os.getenv("metricsFolder", "metrics"),
+        metavar="FOLDER",
+    )
+    run_group.add_argument(
+        "--no_checkpoint",
+        help="Don't spool downloaded pages. By default an interrupted download resumes "
+        "from the last finished page on the next run",
+        action="store_true",
+    )
+    run_group.add_argument(
+        "--no_cache",
+        help="Bypass the on-disk response cache",
+        action="store_true",
+    )
+    run_group.add_argument(
+        "--clear_cache",
+        help="Remove all cached responses before running",
+        action="store_true",
+    )
+
     ### parse groups
     args = parser.parse_args()
 
@@ -92,15 +253,78 @@ def main():
         parser.error(
             "Please provide either a config file, or year and month, or add_year, but not in combination."
         )
+    if args.daemon and not (args.config or args.date_from):
+        parser.error("The service mode needs --config or --from")
+    if args.date_to and not args.date_from:
+        parser.error("Please provide the first month of the range with --from")
+    if args.date_from:
+        if args.config or args.year or args.month or args.add_year:
+            parser.error(
+                "Please provide either a range of months, or a config file, or year and month, "
+                "or add_year, but not in combination."
+            )
+        from datetime import date
+
+        ## without --to the range ends at the current month, taken again on every plan,
+        ## so the service mode may wait for a month that isn't there yet
+        if args.date_to and args.date_from > args.date_to:
+            parser.error("The first month of the range is after the last month")
+        if not (args.date_to or args.daemon) and args.date_from > date.today().strftime("%Y-%m"):
+            parser.error("The first month of the range is after the current month")
+
+    if args.clear_cache:
+        from etl.cache import ResponseCache
+
+        ResponseCache().clear()
+        if not (args.config or args.year or args.month or args.date_from or args.add_year):
+            exit()
+
+    if args.config or args.year or args.month or args.date_from:
+        from downloader import UnemploymentDownloader
 
     if args.config:
-        ETLclient = UnemploymentDownloader(config=args.config)
-    elif args.year or args.month:
-        if not args.year:
+        ETLclient = UnemploymentDownloader(
+            config=args.config,
+            jobs=args.jobs,
+            backend=args.backend,
+            use_cache=not args.no_cache,
+            batch=args.batch,
+            parquet_folder=args.parquet,
+            overwrite=args.overwrite,
+            state=args.state,
+            warehouse_path=args.warehouse,
+            probe=args.probe,
+            metrics_folder=args.metrics,
+            checkpoint=not args.no_checkpoint,
+            transform_workers=args.transform_workers,
+        )
+    elif args.year or args.month or args.date_from:
+        if not args.year and not args.date_from:
             parser.error("Please provide year argument")
-        ETLclient = UnemploymentDownloader(year=args.year, month=args.month)
+        ETLclient = UnemploymentDownloader(
+            year=args.year,
+            month=args.month,
+            date_range=(args.date_from, args.date_to) if args.date_from else None,
+            jobs=args.jobs,
+            backend=args.backend,
+            use_cache=not args.no_cache,
+            batch=args.batch,
+            parquet_folder=args.parquet,
+            overwrite=args.overwrite,
+            state=args.state,
+            warehouse_path=args.warehouse,
+            probe=args.probe,
+            metrics_folder=args.metrics,
+            checkpoint=not args.no_checkpoint,
+            transform_workers=args.transform_workers,
+        )
     elif args.add_year:
-        config_manager = ConfigManager()
+        from utilities import ConfigManager, SqliteConfigManager
+
+        if args.state == "sqlite":
+            config_manager = SqliteConfigManager()
+        else:
+            config_manager = ConfigManager()
         config_manager.load_config("config.json")
         for _ in range(args.add_year):
             config_manager.add_next_year("config.json")
@@ -108,6 +332,31 @@ def main():
     else:
         parser.error("Please provide either a config file or year and month.")
 
+    if args.plan:
+        plan = ETLclient.plan()
+        print(f"Months to download: {plan['months']} ({plan['crawls']} crawls)")
+        print(f"Estimated API requests: {plan['estimated_requests']}")
+        for year, month_list in plan["queue"].items():
+            print(f"{year}: {', '.join(month_list)}")
+        ETLclient.close()
+        exit()
+
+    from logger import get_logger
+    from utilities import delete_logs
+
+    if args.daemon:
+        from scheduler import Scheduler
+
+        logger = get_logger(__name__)
+        logger.info(f"Start service with the arguments: {args}")
+        service = Scheduler(ETLclient, interval=args.interval, heartbeat_file=args.heartbeat)
+        service.install_signal_handlers()
+        try:
+            service.run()
+        finally:
+            ETLclient.close()
+        exit()
+
     try:
         ### init logger
         logger = get_logger(__name__)
@@ -123,6 +372,8 @@ def main():
             "an error occurred that was not handled while the application was running",
         )
         sys.exit(1)
+    finally:
+        ETLclient.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+#####################################################################
+## Tryb usługi: cykliczne sprawdzanie publikacji i uruchamianie ETL ##
+#####################################################################
+
+import json
+import os
+import signal
+import threading
+import time
+from logging import getLogger
+
+from etl.probe import PublicationProbe
+from logger import active_log_files, flush_logs
+from utilities import delete_logs
+
+
+class Scheduler:
+    """
+    Resident service mode around UnemploymentDownloader.
+
+    The downloader, with its connection pool, response cache, probe answers and
+    transform workers, is created once and kept between runs. Every interval seconds
+    the next pending month of every year is checked with the one-row publication probe,
+    and the ETL runs only when one of them is published. Old logs are deleted once
+    a day, except the file the service is writing. A heartbeat file with the state of
+    the service is written after every step.
+
+    SIGTERM and SIGINT stop the service: a running ETL finishes the months in progress,
+    saves the state and the cache, and the service exits.
+
+    Args:
+        downloader (UnemploymentDownloader): The downloader run by the service.
+        interval (float): Seconds between the checks. Defaults to 3600.
+        heartbeat_file (str): Path of the heartbeat file. Defaults to 'heartbeat.json'.
+        log_folder (str): Folder of the log files. Defaults to 'logs'.
+        log_cleanup_interval (float): Seconds between deleting old logs. Defaults to 24 hours.
+    """
+
+    def __init__(
+        self,
+        downloader,
+        interval=3600,
+        heartbeat_file="heartbeat.json",
+        log_folder="logs",
+        log_cleanup_interval=24 * 3600,
+    ):
+        self.downloader = downloader
+        self.interval = interval
+        self.heartbeat_file = heartbeat_file
+        self.log_folder = log_folder
+        self.log_cleanup_interval = log_cleanup_interval
+        self.probe = downloader.probe or PublicationProbe(downloader.api)
+        self.stop_event = threading.Event()
+        self.logger = getLogger("__main__")
+        self.state = {
+            "pid": os.getpid(),
+            "status": "starting",
+            "started": time.time(),
+            "polls": 0,
+            "runs": 0,
+            "last_poll": None,
+            "last_run": None,
+            "last_error": None,
+            "next_poll": None,
+        }
+        self.last_log_cleanup = None
+
+    def install_signal_handlers(self):
+        """
+        Stops the service on SIGTERM and SIGINT. Must be called from the main thread.
+        """
+        for signal_name in ("SIGTERM", "SIGINT"):
+            if hasattr(signal, signal_name):
+                signal.signal(getattr(signal, signal_name), self._handle_signal)
+
+    def _handle_signal(self, signum, frame):
+        ## nothing is logged here, the handler may interrupt the main thread inside logging
+        self.state["signal"] = signum
+        self.stop()
+
+    def stop(self):
+        """
+        Stops the service after the current step.
+        """
+        self.stop_event.set()
+        self.downloader.stop()
+
+    def write_heartbeat(self, status):
+        """
+        Writes the state of the service into the heartbeat file (replaced atomically).
+
+        Args:
+            status (str): Current status, e.g. 'polling', 'running', 'idle' or 'stopped'.
+        """
+        self.state["status"] = status
+        self.state["updated"] = time.time()
+        tmp_path = f"{self.heartbeat_file}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="UTF-8") as f:
+                json.dump(self.state, f, indent=4)
+            os.replace(tmp_path, self.heartbeat_file)
+        except OSError:
+            self.logger.exception("Error while trying to write the heartbeat file")
+
+    def has_new_data(self):
+        """
+        Checks whether the next pending month of any year is published.
+
+        A year stops at its first missing month, so only that month is probed. With
+        a date range missing months are skipped, so the pending months are probed from
+        the newest one until a published month is found. The cached probe answers are
+        dropped first, so every check sends fresh one-row requests.
+
+        Returns:
+            bool: True if the ETL should run.
+        """
+        for year, month_list in self.downloader.pending_months().items():
+            if not month_list:
+                continue
+            if self.downloader.stop_at_missing:
+                months = [min(month_list)]
+            else:
+                months = sorted(month_list, reverse=True)
+            for month in months:
+                variable_id = self.downloader.api.get_variable_id(month)
+                self.probe.forget(variable_id, year)
+                if self.probe.is_published(variable_id, year):
+                    return True
+        return False
+
+    def clean_logs(self):
+        """
+        Deletes old logs, at most once per log_cleanup_interval.
+        """
+        now = time.time()
+        if (
+            self.last_log_cleanup is not None
+            and now - self.last_log_cleanup < self.log_cleanup_interval
+        ):
+            return
+        self.last_log_cleanup = now
+        try:
+            ## the log file of the service is older than 30 days after a month of uptime
+            delete_logs(self.log_folder, keep=active_log_files())
+        except OSError:
+            self.logger.warning("Old logs couldn't be deleted", exc_info=1)
+
+    def run_once(self):
+        """
+        Checks for new data and runs the ETL if there is any.
+
+        Errors are logged and kept in the heartbeat, the service keeps polling.
+        """
+        self.write_heartbeat("polling")
+        self.state["polls"] += 1
+        self.state["last_poll"] = time.time()
+        try:
+            if not self.has_new_data():
+                self.logger.info("No new data published")
+                return
+            self.write_heartbeat("running")
+            self.downloader.run_ETL()
+            self.state["runs"] += 1
+            self.state["last_run"] = time.time()
+            self.state["last_error"] = None
+        except Exception as e:
+            self.state["last_error"] = f"{type(e).__name__}: {e}"
+            self.logger.exception("an error occurred while the service was running")
+        finally:
+            flush_logs()
+
+    def run(self):
+        """
+        Runs the service until stop() is called or a stop signal is received.
+        """
+        self.logger.info(f"The service is started, new data is checked every {self.interval} sec")
+        try:
+            while not self.stop_event.is_set():
+                self.clean_logs()
+                self.run_once()
+                if self.stop_event.is_set():
+                    break
+                self.state["next_poll"] = time.time() + self.interval
+                self.write_heartbeat("idle")
+                self.stop_event.wait(self.interval)
+        finally:
+            self.state["next_poll"] = None
+            self.write_heartbeat("stopped")
+            if self.state.get("signal") is not None:
+                self.logger.info(f"Signal {self.state['signal']} received")
+            self.logger.info("The service is stopped")
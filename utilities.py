@@ -6,6 +6,8 @@ import json
 from datetime import datetime, timedelta
 from abc import ABC, abstractmethod
 import os
+import sqlite3
+import threading
 
 
 class IConfigManager(ABC):
@@ -21,9 +23,22 @@ class IConfigManager(ABC):
     def get_value(self, key: str) -> any:
         pass
 
+    def flush(self, file_path: str) -> None:
+        """
+        Persists pending changes. The JSON manager writes on every update, so there is nothing to do.
+        """
+        pass
+
+    def record_failure(self, file_path: str, year: str, month: str) -> None:
+        """
+        Records a failed attempt to download a month. The JSON layout keeps no attempts.
+        """
+        pass
+
 
 class ConfigManager(IConfigManager):
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -44,7 +59,13 @@ class ConfigManager(IConfigManager):
             self.config = json.load(f)
 
     def update_config(
-        self, file_path: str, year: str, month: str, value: bool = True
+        self,
+        file_path: str,
+        year: str,
+        month: str,
+        value: bool = True,
+        row_count: int = None,
+        content_hash: str = None,
     ) -> None:
         """
         Updates the configuration for a specific year and month with the provided value.
@@ -54,26 +75,30 @@ class ConfigManager(IConfigManager):
             year (str): The year for which the configuration needs to be updated.
             month (str): The month for which the configuration needs to be updated.
             value (bool): The value to be set for the specified year and month.
+            row_count (int, optional): Number of saved rows, not stored in config.json.
+            content_hash (str, optional): Hash of the saved file, not stored in config.json.
 
         Raises:
             ValueError: If the specified year or month is invalid or not found in the config file.
         """
-        year_config = self._get_year_config(year)
+        with self._lock:
+            year_config = self._get_year_config(year)
 
-        month_config_parent = year_config["Months"]
+            month_config_parent = year_config["Months"]
 
-        if month in month_config_parent:
-            month_config_parent[month] = value
-            year_config["All_downloaded"] = all(
-                month_downloaded for month_downloaded in year_config["Months"].values()
-            )
-        else:
-            raise ValueError(
-                f"Invalid month '{month}'. Month not found for year '{year}' in config file."
-            )
+            if month in month_config_parent:
+                month_config_parent[month] = value
+                year_config["All_downloaded"] = all(
+                    month_downloaded
+                    for month_downloaded in year_config["Months"].values()
+                )
+            else:
+                raise ValueError(
+                    f"Invalid month '{month}'. Month not found for year '{year}' in config file."
+                )
 
-        with open(file_path, "w") as f:
-            json.dump(self.config, f, indent=4)
+            with open(file_path, "w") as f:
+                json.dump(self.config, f, indent=4)
 
     def get_value(self, key: str) -> any:
         """
@@ -117,20 +142,40 @@ class ConfigManager(IConfigManager):
         Args:
             file_path (str): The path to the configuration file.
         """
-        # Check the earliest year
-        years = self.config["Year"].keys()
-        earliest_year = max(map(int, years))
-
-        # Create the next year and months from 01 to 12
-        next_year = str(earliest_year + 1)
-        self.config["Year"][next_year] = {
-            "All_downloaded": False,
-            "Months": {str(month).zfill(2): False for month in range(1, 13)},
-        }
+        with self._lock:
+            # Check the earliest year
+            years = self.config["Year"].keys()
+            earliest_year = max(map(int, years))
+
+            # Create the next year and months from 01 to 12
+            next_year = str(earliest_year + 1)
+            self.config["Year"][next_year] = {
+                "All_downloaded": False,
+                "Months": {str(month).zfill(2): False for month in range(1, 13)},
+            }
+
+            # Save the changes to the file
+            with open(file_path, "w") as f:
+                json.dump(self.config, f, indent=4)
+
+    def add_year(self, file_path: str, year: str) -> None:
+        """
+        Adds a year with all months set to False, if it isn't in the configuration yet.
 
-        # Save the changes to the file
-        with open(file_path, "w") as f:
-            json.dump(self.config, f, indent=4)
+        Args:
+            file_path (str): The path to the configuration file.
+            year (str): The year to add.
+        """
+        with self._lock:
+            years = self.config.setdefault("Year", {})
+            if year in years:
+                return
+            years[year] = {
+                "All_downloaded": False,
+                "Months": {str(month).zfill(2): False for month in range(1, 13)},
+            }
+            with open(file_path, "w") as f:
+                json.dump(self.config, f, indent=4)
 
     def check_all_data_downloaded(self, file_path: str) -> None:
         """
@@ -191,12 +236,430 @@ class ConfigManager(IConfigManager):
         return month_config
 
 
+class SqliteConfigManager(IConfigManager):
+    """
+    Download state stored in a SQLite database (WAL mode) instead of config.json.
+
+    Every (year, month) row keeps the downloaded flag, status, attempt count, row
+    count and content hash. Updates are queued and written in batched transactions.
+    The state is imported from config.json when the database is empty and can be
+    exported back to the config.json layout with flush() or export_config(). Later
+    loads merge config.json into the state: months the state doesn't have are added,
+    and if config.json was changed after the last export its flags win.
+
+    Args:
+        db_path (str): Path to the database file. Defaults to 'state.db'.
+        batch_size (int): Number of queued updates written in one transaction. Defaults to 12.
+    """
+
+    MONTHS = [str(month).zfill(2) for month in range(1, 13)]
+
+    def __init__(self, db_path: str = "state.db", batch_size: int = 12):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS download_state (
+                    year TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    downloaded INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    row_count INTEGER,
+                    content_hash TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (year, month)
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_download_state_downloaded "
+                "ON download_state (downloaded, year, month)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS state_meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def load_config(self, file_path: str) -> None:
+        """
+        Imports the state from the config file if the database is empty, otherwise
+        merges the config file into the state.
+
+        Args:
+            file_path (str): The path to the configuration file.
+        """
+        if not os.path.exists(file_path):
+            return
+        with self.lock:
+            count = self.connection.execute(
+                "SELECT COUNT(*) FROM download_state"
+            ).fetchone()[0]
+        if count == 0:
+            self.import_config(file_path)
+        else:
+            self.merge_config(file_path)
+
+    def merge_config(self, file_path: str) -> None:
+        """
+        Merges a config.json file into the state.
+
+        Years and months the state doesn't have are added, e.g. after --add_year with
+        the JSON state. When the file was modified after the last export (edited by
+        hand or by the JSON state), its downloaded flags replace the stored ones.
+
+        Args:
+            file_path (str): The path to the configuration file.
+        """
+        with open(file_path) as f:
+            config = json.load(f)
+        if "Year" not in config:
+            raise ValueError("Invalid config file. 'Year' key not found.")
+        rows = [
+            (year, month, int(bool(downloaded)))
+            for year, year_data in config["Year"].items()
+            for month, downloaded in year_data["Months"].items()
+        ]
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock:
+            self._flush_pending()
+            exported = self.connection.execute(
+                "SELECT value FROM state_meta WHERE key = 'exported_mtime'"
+            ).fetchone()
+            changed = exported is None or os.path.getmtime(file_path) > float(exported[0])
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO download_state (year, month, downloaded, status, updated_at) "
+                    "VALUES (?, ?, ?, CASE WHEN ? THEN 'downloaded' ELSE 'pending' END, ?)",
+                    [(year, month, downloaded, downloaded, now) for year, month, downloaded in rows],
+                )
+                if changed:
+                    self.connection.executemany(
+                        "UPDATE download_state SET downloaded = ?, "
+                        "status = CASE WHEN ? THEN 'downloaded' ELSE 'pending' END, updated_at = ? "
+                        "WHERE year = ? AND month = ? AND downloaded != ?",
+                        [
+                            (downloaded, downloaded, now, year, month, downloaded)
+                            for year, month, downloaded in rows
+                        ],
+                    )
+
+    def import_config(self, file_path: str) -> None:
+        """
+        Replaces the state with the content of a config.json file.
+
+        Args:
+            file_path (str): The path to the configuration file.
+        """
+        with open(file_path) as f:
+            config = json.load(f)
+        if "Year" not in config:
+            raise ValueError("Invalid config file. 'Year' key not found.")
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (year, month, int(bool(downloaded)), "downloaded" if downloaded else "pending", now)
+            for year, year_data in config["Year"].items()
+            for month, downloaded in year_data["Months"].items()
+        ]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM download_state")
+            self.connection.executemany(
+                "INSERT INTO download_state (year, month, downloaded, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def export_config(self, file_path: str) -> None:
+        """
+        Writes the state in the config.json layout.
+
+        Args:
+            file_path (str): The path to the configuration file.
+        """
+        config = self.to_config()
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, file_path)
+        ## the next load can tell whether the file was changed by something else since
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state_meta (key, value) VALUES ('exported_mtime', ?)",
+                (repr(os.path.getmtime(file_path)),),
+            )
+
+    def to_config(self) -> dict:
+        """
+        Returns the state in the config.json layout.
+
+        Returns:
+            dict: {"Year": {year: {"All_downloaded": bool, "Months": {month: bool}}}}
+        """
+        self._flush_pending()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT year, month, downloaded FROM download_state ORDER BY year, month"
+            ).fetchall()
+        config = {"Year": {}}
+        for year, month, downloaded in rows:
+            year_config = config["Year"].setdefault(
+                year, {"All_downloaded": True, "Months": {}}
+            )
+            year_config["Months"][month] = bool(downloaded)
+            year_config["All_downloaded"] = year_config["All_downloaded"] and bool(
+                downloaded
+            )
+        return config
+
+    def update_config(
+        self,
+        file_path: str,
+        year: str,
+        month: str,
+        value: bool = True,
+        row_count: int = None,
+        content_hash: str = None,
+    ) -> None:
+        """
+        Queues an update of the state for a specific year and month.
+
+        Args:
+            file_path (str): Not used, kept for compatibility with ConfigManager.
+            year (str): The year for which the state needs to be updated.
+            month (str): The month for which the state needs to be updated.
+            value (bool): Whether the month is downloaded.
+            row_count (int, optional): Number of saved rows.
+            content_hash (str, optional): Hash of the saved file.
+
+        Raises:
+            ValueError: If the specified year or month is not found in the state.
+        """
+        with self.lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM download_state WHERE year = ? AND month = ?",
+                (year, month),
+            ).fetchone()
+            if exists is None:
+                raise ValueError(
+                    f"Invalid year '{year}' or month '{month}'. Not found in the download state."
+                )
+            self.pending.append(
+                (
+                    int(bool(value)),
+                    "downloaded" if value else "pending",
+                    row_count,
+                    content_hash,
+                    datetime.now().isoformat(timespec="seconds"),
+                    year,
+                    month,
+                )
+            )
+            if len(self.pending) >= self.batch_size:
+                self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE download_state SET downloaded = ?, status = ?, attempts = attempts + 1, "
+                    "row_count = COALESCE(?, row_count), content_hash = COALESCE(?, content_hash), "
+                    "updated_at = ? WHERE year = ? AND month = ?",
+                    self.pending,
+                )
+            self.pending = []
+
+    def record_failure(self, file_path: str, year: str, month: str) -> None:
+        """
+        Records a failed attempt for a specific year and month. The attempts counter
+        is increased and the status set to 'failed', a downloaded month stays downloaded.
+        Months that are not in the state are ignored.
+
+        Args:
+            file_path (str): Not used, kept for compatibility with ConfigManager.
+            year (str): The year of the failed month.
+            month (str): The failed month.
+        """
+        with self.lock:
+            ## queued updates are written first, so they don't overwrite the failure
+            self._flush_pending()
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE download_state SET status = CASE WHEN downloaded = 1 "
+                    "THEN status ELSE 'failed' END, attempts = attempts + 1, updated_at = ? "
+                    "WHERE year = ? AND month = ?",
+                    (datetime.now().isoformat(timespec="seconds"), year, month),
+                )
+
+    def flush(self, file_path: str = None) -> None:
+        """
+        Writes the queued updates and exports the state to the config file.
+
+        Args:
+            file_path (str, optional): The path to the configuration file. Defaults to None (no export).
+        """
+        self._flush_pending()
+        if file_path:
+            self.export_config(file_path)
+
+    def get_value(self, key: str) -> any:
+        """
+        Retrieves the value associated with the specified key, using the config.json layout.
+
+        Args:
+            key (str): The key for which the value needs to be retrieved, e.g. 'Year.2023.All_downloaded'.
+
+        Returns:
+            any: The value associated with the specified key, or None if the key is not found.
+        """
+        value = self.to_config()
+        for k in key.split("."):
+            value = value.get(k)
+            if value is None:
+                return None
+        return value
+
+    def get_download_options(self):
+        """
+        Retrieves the years and months that have not been downloaded.
+
+        Returns:
+            dict: A dictionary containing the years as keys and the list of months to be downloaded as values.
+        """
+        self._flush_pending()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT year, month FROM download_state WHERE downloaded = 0 ORDER BY year, month"
+            ).fetchall()
+        key_to_download = {}
+        for year, month in rows:
+            key_to_download.setdefault(year, []).append(month)
+        return key_to_download
+
+    def get_state(self, year: str, month: str):
+        """
+        Returns the stored state of a year and month.
+
+        Returns:
+            dict: downloaded, status, attempts, row_count, content_hash and updated_at,
+                or None if the month is not in the state.
+        """
+        self._flush_pending()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT downloaded, status, attempts, row_count, content_hash, updated_at "
+                "FROM download_state WHERE year = ? AND month = ?",
+                (year, month),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["downloaded", "status", "attempts", "row_count", "content_hash", "updated_at"]
+        state = dict(zip(keys, row))
+        state["downloaded"] = bool(state["downloaded"])
+        return state
+
+    def add_next_year(self, file_path: str = None) -> None:
+        """
+        Adds the year after the latest one with all months not downloaded.
+
+        Args:
+            file_path (str, optional): If given, the state is also exported to this config file.
+        """
+        self._flush_pending()
+        with self.lock, self.connection:
+            latest = self.connection.execute(
+                "SELECT MAX(CAST(year AS INTEGER)) FROM download_state"
+            ).fetchone()[0]
+            next_year = str((latest or datetime.today().year - 1) + 1)
+            now = datetime.now().isoformat(timespec="seconds")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO download_state (year, month, updated_at) VALUES (?, ?, ?)",
+                [(next_year, month, now) for month in self.MONTHS],
+            )
+        if file_path:
+            self.export_config(file_path)
+
+    def add_year(self, file_path: str, year: str) -> None:
+        """
+        Adds a year with all months not downloaded, if it isn't in the state yet.
+
+        Args:
+            file_path (str): Not used, the state is exported by flush().
+            year (str): The year to add.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO download_state (year, month, updated_at) VALUES (?, ?, ?)",
+                [(year, month, now) for month in self.MONTHS],
+            )
+
+    def check_all_data_downloaded(self, file_path: str = None) -> None:
+        """
+        Adds the next year if all months in the state are downloaded.
+
+        Args:
+            file_path (str, optional): If given, the state is also exported to this config file
+                when a year is added.
+        """
+        with self.lock:
+            ## queued updates are taken into account without writing them
+            queued = {(year, month): downloaded for downloaded, *_, year, month in self.pending}
+            not_downloaded = self.connection.execute(
+                "SELECT year, month FROM download_state WHERE downloaded = 0 LIMIT ?",
+                (len(queued) + 1,),
+            ).fetchall()
+            missing = [key for key in not_downloaded if not queued.get(key)]
+            missing += [key for key, downloaded in queued.items() if not downloaded]
+        if not missing:
+            self.add_next_year(file_path)
+
+    def close(self) -> None:
+        """
+        Writes the queued updates and closes the database.
+        """
+        self._flush_pending()
+        self.connection.close()
+
+
+def month_range(start: str, end: str) -> list:
+    """
+    Returns the months between two months, both included.
+
+    Args:
+        start (str): The first month, YYYY-MM.
+        end (str): The last month, YYYY-MM.
+
+    Returns:
+        list: (year, month) tuples of strings in chronological order, e.g. ("2023", "01").
+
+    Raises:
+        ValueError: If a month has a wrong format or start is after end.
+    """
+    start_date = datetime.strptime(start, "%Y-%m")
+    end_date = datetime.strptime(end, "%Y-%m")
+    if start_date > end_date:
+        raise ValueError(f"The first month '{start}' is after the last month '{end}'")
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append((str(year), str(month).zfill(2)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
 #################################################################################
 ############ USUWANIE LOGOW GDY CZAS LOGU JEST DŁUŻSZY NIŻ 30 DNI ###############
 #################################################################################
 
 
-def delete_logs(folder_name: str) -> None:
+def delete_logs(folder_name: str, keep=()) -> None:
     ### calculate current date and curr date -30 days
     today = datetime.today()
     month_ago = today - timedelta(days=30)
@@ -204,6 +667,9 @@ def delete_logs(folder_name: str) -> None:
     ## iterate though the log folder
     for file_name in os.listdir(folder_name):
         file_path = os.path.join(folder_name, file_name)
+        ## files still written by a running process (e.g. the service) are kept
+        if os.path.abspath(file_path) in keep:
+            continue
 
         if file_name.endswith("log"):
             ## get date from the file name